@@ -0,0 +1,70 @@
+"""Several rankings over n items: one sorted() per ranking vs a single qp.libs.aggregate pass
+
+usage: python -m benchmarks.bench_aggregate [--items 100000] [--repeat 5]
+"""
+import timeit
+import argparse
+from collections import Counter
+from qp.libs.aggregate import TopItems, TopCounts, aggregate, year_of, month_of
+from qp.libs.snapshot import compact_item
+from benchmarks.fakes import make_item
+
+
+def _items(n):
+    items = []
+    for i in range(n):
+        item = compact_item(make_item(i))
+        item['created_at'] = f'{2015 + i % 6}-{1 + i % 12:02d}-01T00:00:00+09:00'
+        items.append(item)
+    return items
+
+
+DEFINITIONS = [
+    TopItems('likes', k=5, score=lambda item: item['likes_count']),
+    TopItems('likes_by_month', k=3, score=lambda item: item['likes_count'], group=month_of),
+    TopCounts('tags', k=10, keys=lambda item: item['tags']),
+    TopCounts('tags_by_year', k=3, keys=lambda item: item['tags'], group=year_of),
+]
+
+
+def _sorted(items):
+    """元の contribution_summarize と同じく、ランキングごとに全件をソートする"""
+    results = {}
+    results['likes'] = sorted(items, key=lambda item: item['likes_count'], reverse=True)[:5]
+    months = {}
+    for item in items:
+        months.setdefault(month_of(item), []).append(item)
+    results['likes_by_month'] = {
+        month: sorted(group, key=lambda item: item['likes_count'], reverse=True)[:3]
+        for month, group in months.items()
+    }
+    tags = Counter(tag for item in items for tag in item['tags'])
+    results['tags'] = [(k, tags[k]) for k in sorted(tags, key=lambda k: tags[k], reverse=True)[:10]]
+    years = {}
+    for item in items:
+        years.setdefault(year_of(item), Counter()).update(item['tags'])
+    results['tags_by_year'] = {
+        year: [(k, c[k]) for k in sorted(c, key=lambda k: c[k], reverse=True)[:3]]
+        for year, c in years.items()
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    items = _items(args.items)
+    assert aggregate(items, DEFINITIONS) == _sorted(items)
+    for label, func in [
+        ('sorted() per ranking', lambda: _sorted(items)),
+        ('aggregate() single pass', lambda: aggregate(items, DEFINITIONS)),
+    ]:
+        elapsed = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f'{label:<28} {elapsed * 1000:8.1f} ms  ({args.items} items, {len(DEFINITIONS)} rankings)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""DecimalEncoder JSON round-trip vs qp.libs.codec on large nested template_variables
+
+usage: python -m benchmarks.bench_codec [--items 5000] [--repeat 20]
+"""
+import json
+import timeit
+import argparse
+from qp.libs.codec import from_dynamodb, to_dynamodb
+from qp.libs.renderconfig import DecimalEncoder
+
+
+def _template_variables(n):
+    return {
+        'items': [
+            {'name': f'item {i}', 'link': f'https://qiita.com/example/items/{i:020x}', 'likes': i % 97}
+            for i in range(n)
+        ],
+        'tags_count': [
+            {'name': f'tag{i}', 'count': n - i}
+            for i in range(n // 10)
+        ],
+        'ratio': 0.25,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    native = {'article': 'bench', 'template_name': 'portfolio.jinja2', 'template_variables': _template_variables(args.items)}
+    stored = to_dynamodb(native)
+    assert from_dynamodb(stored) == json.loads(json.dumps(stored, cls=DecimalEncoder))
+
+    cases = [
+        ('decode: DecimalEncoder round-trip', lambda: json.loads(json.dumps(stored, cls=DecimalEncoder))),
+        ('decode: codec.from_dynamodb', lambda: from_dynamodb(stored)),
+        ('decode: native fast path', lambda: from_dynamodb(native)),
+        ('encode: codec.to_dynamodb', lambda: to_dynamodb(native)),
+    ]
+    for label, func in cases:
+        elapsed = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f'{label:<36} {elapsed * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
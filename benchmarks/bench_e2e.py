@@ -0,0 +1,185 @@
+"""Offline end-to-end benchmark of the handlers against the fake Qiita API, article table and SQS queue
+
+scenarios (n = --scales):
+
+- contribution: contribution_summarize.handler over n Qiita items
+  (SNAPSHOT_BACKEND none, then dynamodb full crawl and incremental run)
+- jobconsumer:  n template_variables messages for n articles, drained in SQS batches of 10
+  through jobconsumer.handler (PUBLISHER_MODE express)
+- publish:      publish_article for one article whose template_variables hold n liked items
+  (create, unchanged, update)
+
+Each scenario runs twice on fresh fakes: once for wall time, once under tracemalloc for peak
+Python memory (the fake server thread allocates in the same process and is included).
+Handler logs are formatted as usual and written to /dev/null unless --show-logs is given.
+
+usage: python -m benchmarks.bench_e2e [--scales 10,100,1000,10000] [--latency 0] [--scenarios contribution,jobconsumer,publish]
+"""
+import os
+import time
+import logging
+import argparse
+import tracemalloc
+from qp import settings, logs
+from qp.libs.qiitaclient import PooledQiitaClient
+from qp.libs.jobqueue import enqueue_template_variables
+from qp.functions import jobconsumer
+from qp.functions.jobs import contribution_summarize
+from qp.functions.sfn.publish import publish_article
+from benchmarks.fakes import FakeQiitaServer, FakeTable, FakeSQSClient, install, seed_article
+
+# 1 時間あたりの上限に当たらないようにする (レート制限の挙動は bench_http_pool で見る)
+RATE_LIMIT = 10 ** 7
+
+
+class Fakes(object):
+    """Fresh fake Qiita server / article table / SQS queue installed into qp"""
+
+    def __init__(self, total: int=0, latency: float=0.0):
+        self.server = FakeQiitaServer(total=total, latency=latency, rate_limit=RATE_LIMIT)
+        self.table = FakeTable()
+        self.sqs = FakeSQSClient()
+
+    def __enter__(self):
+        self.server.__enter__()
+        install(
+            table=self.table,
+            sqs=self.sqs,
+            qiita_client=PooledQiitaClient(access_token='dummy', base_url=self.server.base_url)
+        )
+        return self
+
+    def __exit__(self, *exc):
+        self.server.__exit__(*exc)
+
+    def reset_counters(self):
+        self.server.reset_counters()
+        self.table.calls.clear()
+        self.sqs.calls.clear()
+
+    def calls(self) -> dict:
+        return {
+            'qiita': dict(self.server.calls),
+            'dynamodb': dict(self.table.calls),
+            'sqs': dict(self.sqs.calls),
+        }
+
+
+def _variables(n: int, version: int=0) -> dict:
+    return {
+        'items': [
+            {'name': f'item {i}', 'link': f'https://qiita.com/example/items/{i:020x}', 'likes': n - i + version}
+            for i in range(n)
+        ],
+        'tags_count': [{'name': f'tag{i}', 'count': 10 - i} for i in range(10)],
+    }
+
+
+def contribution(n: int, latency: float):
+    """Yields (phase, fakes, run) where run() executes the phase. 各シナリオ関数は同じ形で yield する"""
+    with Fakes(total=n, latency=latency) as fakes:
+        settings.SNAPSHOT_BACKEND = 'none'
+        yield 'stream', fakes, lambda: contribution_summarize.handler({}, {})
+        settings.SNAPSHOT_BACKEND = 'dynamodb'
+        yield 'snapshot full', fakes, lambda: contribution_summarize.handler({'full': True}, {})
+        yield 'snapshot incremental', fakes, lambda: contribution_summarize.handler({}, {})
+        settings.SNAPSHOT_BACKEND = 'none'
+
+
+def jobconsumer_batches(n: int, latency: float):
+    with Fakes(latency=latency) as fakes:
+        settings.PUBLISHER_MODE = 'express'
+        variables = _variables(5)
+        for a in range(n):
+            seed_article(fakes.table, f'article {a}', variables)
+            enqueue_template_variables(f'article {a}', _variables(5, version=a))
+
+        def drain():
+            failures = 0
+            while True:
+                event = fakes.sqs.to_lambda_event(batch_size=10)
+                if not event['Records']:
+                    return failures
+                failures += len(jobconsumer.handler(event, {})['batchItemFailures'])
+        yield 'express', fakes, drain
+
+
+def publish(n: int, latency: float):
+    with Fakes(latency=latency) as fakes:
+        seed_article(fakes.table, 'article', _variables(n))
+        yield 'create', fakes, lambda: publish_article({'article': 'article'}, {})
+        yield 'unchanged', fakes, lambda: publish_article({'article': 'article'}, {})
+        seed_article(fakes.table, 'article', _variables(n, version=1))
+        yield 'update', fakes, lambda: publish_article({'article': 'article'}, {})
+
+
+SCENARIOS = {
+    'contribution': contribution,
+    'jobconsumer': jobconsumer_batches,
+    'publish': publish,
+}
+
+
+def _measure(scenario, n: int, latency: float, trace: bool) -> list:
+    results = []
+    for phase, fakes, run in scenario(n, latency):
+        fakes.reset_counters()
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        peak = None
+        if trace:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        results.append((phase, elapsed, fakes.calls(), peak))
+    return results
+
+
+def _silence_logs(stream):
+    """Keep log formatting cost but write the lines to stream"""
+    for log in logs.loggers.values():
+        for handler in log.handlers:
+            if isinstance(handler, logging.StreamHandler):
+                handler.setStream(stream)
+    if logs.listener is not None:
+        for handler in logs.listener.handlers:
+            handler.setStream(stream)
+
+
+def _format_calls(calls: dict) -> str:
+    """{'qiita': {'list_items': 10}, 'dynamodb': {}} -> 'qiita(list_items=10)'"""
+    return ' '.join(
+        f"{service}({','.join(f'{name}={count}' for name, count in sorted(counts.items()))})"
+        for service, counts in calls.items()
+        if counts
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', default='10,100,1000,10000')
+    parser.add_argument('--latency', type=float, default=0.0, help='Qiita API latency (seconds)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--skip-memory', action='store_true', help='do not run the tracemalloc pass')
+    parser.add_argument('--show-logs', action='store_true')
+    args = parser.parse_args()
+
+    devnull = open(os.devnull, 'w')
+    if not args.show_logs:
+        _silence_logs(devnull)
+
+    print(f'{"scenario":<13} {"n":>6} {"phase":<21} {"wall ms":>10} {"peak MB":>8}  calls')
+    for name in args.scenarios.split(','):
+        for n in [int(s) for s in args.scales.split(',')]:
+            timed = _measure(SCENARIOS[name], n, args.latency, trace=False)
+            traced = [None] * len(timed) if args.skip_memory else _measure(SCENARIOS[name], n, args.latency, trace=True)
+            for (phase, elapsed, calls, _), t in zip(timed, traced):
+                peak = '-' if t is None else f'{t[3] / 2 ** 20:.1f}'
+                print(f'{name:<13} {n:>6} {phase:<21} {elapsed * 1000:>10.1f} {peak:>8}  {_format_calls(calls)}')
+    devnull.close()
+
+
+if __name__ == '__main__':
+    main()
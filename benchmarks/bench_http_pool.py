@@ -0,0 +1,54 @@
+"""Handshake count and latency per request: stock qiita_v2 client vs pooled session
+
+Runs a local HTTPS stub with a self-signed certificate (openssl is required).
+
+usage: python -m benchmarks.bench_http_pool [--requests 200]
+"""
+import os
+import time
+import argparse
+import tempfile
+from qiita_v2.client import QiitaClient
+from qp.libs import qiitaclient
+from qp.libs.qiitaclient import PooledQiitaClient
+from benchmarks.fakes import FakeQiitaServer, make_self_signed_cert
+
+
+class StockQiitaClient(QiitaClient):
+    """qiita_v2 client pointed at the stub (one connection per request)"""
+
+    def __init__(self, base_url):
+        super().__init__(access_token='dummy')
+        self.base_url = base_url
+
+    def _url_prefix(self):
+        return self.base_url
+
+
+def _run(label, server, client, n):
+    server.reset_counters()
+    started = time.perf_counter()
+    for i in range(n):
+        client.get_item(f'{i % server.total:020x}')
+    elapsed = time.perf_counter() - started
+    print(f'{label:<10} requests={n:<5} handshakes={server.connections:<5} '
+          f'latency={elapsed / n * 1000:7.2f} ms/request')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        certfile = make_self_signed_cert(os.path.join(d, 'localhost.pem'))
+        # requests は REQUESTS_CA_BUNDLE を信頼する
+        os.environ['REQUESTS_CA_BUNDLE'] = certfile
+        with FakeQiitaServer(total=100, certfile=certfile) as server:
+            _run('stock', server, StockQiitaClient(server.base_url), args.requests)
+            qiitaclient.session = None
+            _run('pooled', server, PooledQiitaClient(access_token='dummy', base_url=server.base_url), args.requests)
+
+
+if __name__ == '__main__':
+    main()
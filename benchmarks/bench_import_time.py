@@ -0,0 +1,68 @@
+"""Cold-start import cost of every Lambda handler in serverless.yml (python -X importtime)
+
+Each sample imports the handler module in a fresh interpreter. The cost is
+the cumulative import time of the handler module itself; interpreter
+startup (site) is excluded. The heaviest packages pulled in by the handler
+are listed below it.
+
+usage: python -m benchmarks.bench_import_time [--runs 5] [--top 5]
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+from qp.libs.localsfn import load_serverless
+
+
+def _importtime(module):
+    """Returns (cumulative_us of module, {top-level package: cumulative_us}) of one fresh import
+
+    Only packages imported while importing the module are counted (not the ones site imports).
+    """
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        check=True, capture_output=True, text=True
+    ).stderr
+    lines = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        lines.append((depth, name.strip(), int(cumulative_us)))
+
+    # importtime は子を親より先に出力するので、モジュールの行から遡って深い行を集める
+    index = max(i for i, (_, name, _) in enumerate(lines) if name == module)
+    depth, _, cumulative = lines[index]
+    packages = {}
+    for d, name, us in reversed(lines[:index]):
+        if d <= depth:
+            break
+        top = name.split('.')[0]
+        if top != 'qp':
+            packages[top] = max(packages.get(top, 0), us)
+    return cumulative, packages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='show the N heaviest top-level packages per handler')
+    args = parser.parse_args()
+
+    functions = load_serverless()['functions']
+    modules = {}
+    for name, function in functions.items():
+        module = function['handler'].rsplit('.', 1)[0].replace('/', '.')
+        modules.setdefault(module, []).append(name)
+
+    for module, names in modules.items():
+        samples = [_importtime(module) for _ in range(args.runs)]
+        cost = statistics.median(cumulative for cumulative, _ in samples) / 1000
+        print(f'{module:<45} {cost:8.1f} ms  ({", ".join(names)})')
+        packages = samples[-1][1]
+        for name, cumulative in sorted(packages.items(), key=lambda p: -p[1])[:args.top]:
+            print(f'{"":<4}{name:<41} {cumulative / 1000:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""Peak memory of listing own items with and without field projection
+
+usage: python -m benchmarks.bench_item_projection [--items 5000] [--body-size 20000]
+"""
+import argparse
+import time
+import tracemalloc
+from qp.libs.qiita import create_qiita
+from qp.functions.jobs.contribution_summarize import ITEM_FIELDS
+from benchmarks.fakes import FakeQiitaClient
+
+
+def _measure(label, func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<32} items={count:<6} peak={peak / 1024 / 1024:8.1f} MiB  time={elapsed:6.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--body-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    def qiita():
+        return create_qiita(FakeQiitaClient(total=args.items, body_size=args.body_size))
+
+    _measure('list_own_items()', lambda: len(qiita().list_own_items(max_workers=1)))
+    _measure('list_own_items(fields)', lambda: len(qiita().list_own_items(max_workers=1, fields=ITEM_FIELDS)))
+    _measure('iter_own_items(fields)', lambda: sum(1 for _ in qiita().iter_own_items(max_workers=1, fields=ITEM_FIELDS)))
+
+
+if __name__ == '__main__':
+    main()
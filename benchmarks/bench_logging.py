@@ -0,0 +1,93 @@
+"""qp.logs の 1 秒あたりの出力レコード数
+
+元の実装 (呼び出しごとに JsonLogger + StreamHandler を作り、dict の msg は str() する) と、
+キャッシュ済み logger + JsonFormatter、LOG_QUEUE を有効にした場合を比べる。出力は /dev/null に捨てる
+
+usage: python -m benchmarks.bench_logging [--records 20000]
+"""
+import os
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+
+from qp import logs, settings
+
+
+class LegacyJsonFormatter(logging.Formatter):
+    def format(self, record):
+        line = {
+            'level': logging.getLevelName(record.levelno),
+            'name': record.name,
+        }
+        dt = datetime.fromtimestamp(record.created)
+        line['@timestamp'] = dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        line['msg'] = record.msg if not isinstance(record.msg, dict) else str(record.msg)
+        return json.dumps(line)
+
+
+def _legacy_get_logger(name, stream):
+    log = logs.JsonLogger(name, 'INFO')
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(LegacyJsonFormatter())
+    log.addHandler(handler)
+    return log
+
+
+def _redirect(stream):
+    """キャッシュ済み logger の出力先を stream に変える"""
+    for log in logs.loggers.values():
+        for handler in log.handlers:
+            if isinstance(handler, logging.StreamHandler):
+                handler.setStream(stream)
+    if logs.listener is not None:
+        for handler in logs.listener.handlers:
+            handler.setStream(stream)
+
+
+def _message(i):
+    return {'event': 'bench', 'article': f'article-{i % 50}', 'item_id': f'{i:020x}', 'likes_count': i % 97}
+
+
+def _run(label, emit, records, drain=None):
+    start = time.perf_counter()
+    for i in range(records):
+        emit(i)
+    hot = time.perf_counter() - start
+    if drain is not None:
+        drain()
+    total = time.perf_counter() - start
+    print(f'{label:<40} {records / hot:12,.0f} records/s (hot path)  {records / total:12,.0f} records/s (total)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(os.devnull, 'w') as devnull:
+        # 元の deco.from_sfn と同じく、レコードごとに get_logger する
+        _run('legacy: get_logger per call', lambda i: _legacy_get_logger('bench', devnull).info(_message(i)), args.records)
+
+        log = _legacy_get_logger('bench', devnull)
+        _run('legacy: module-level logger', lambda i: log.info(_message(i)), args.records)
+
+        settings.LOG_QUEUE = False
+        logs.loggers.clear()
+        logs.get_logger('bench.stream', 'INFO')
+        _redirect(devnull)
+        _run('cached: get_logger per call', lambda i: logs.get_logger('bench.stream', 'INFO').info(_message(i)), args.records)
+
+        settings.LOG_QUEUE = True
+        log = logs.get_logger('bench.queue', 'INFO')
+        _redirect(devnull)
+
+        def drain():
+            logs.listener.stop()
+            logs.listener.start()
+        _run('cached: LOG_QUEUE=1', lambda i: log.info(_message(i)), args.records, drain)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Publisher pipeline latency: local state machine executor vs in-process express pipeline
+
+Both run against the fake Qiita server and the in-memory article table.
+The state machine numbers exclude Lambda cold starts and Step Functions
+transitions, so they show the handler work per state.
+
+usage: python -m benchmarks.bench_publisher [--articles 20] [--latency 0.05]
+"""
+import time
+import argparse
+from collections import defaultdict
+from qp.libs.qiitaclient import PooledQiitaClient
+from qp.libs.localsfn import LocalStateMachine
+from qp.functions.sfn.publish import publish_article
+from benchmarks.fakes import FakeQiitaServer, FakeTable, install, seed_article
+
+
+def _variables(version):
+    return {
+        'items': [{'name': f'item {i}', 'link': f'https://qiita.com/x/items/{i}', 'likes': i + version} for i in range(5)],
+        'tags_count': [{'name': f'tag{i}', 'count': 10 - i} for i in range(10)],
+    }
+
+
+def _run(label, server, articles, run):
+    table = FakeTable()
+    install(table=table, qiita_client=PooledQiitaClient(access_token='dummy', base_url=server.base_url))
+    states = defaultdict(float)
+    for phase, version in [('create', 0), ('unchanged', 0), ('update', 1)]:
+        for a in range(articles):
+            seed_article(table, f'article {a}', _variables(version))
+        server.reset_counters()
+        table.calls.clear()
+        started = time.perf_counter()
+        for a in range(articles):
+            for state, elapsed in run(f'article {a}'):
+                states[state] += elapsed
+        elapsed = time.perf_counter() - started
+        print(f'{label:<8} {phase:<10} {elapsed / articles * 1000:8.1f} ms/article  '
+              f'qiita={dict(server.calls)} dynamodb={dict(table.calls)}')
+    for state, elapsed in states.items():
+        print(f'{"":<8} {state:<32} {elapsed / articles / 3 * 1000:8.1f} ms/article')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05, help='Qiita API latency (seconds)')
+    args = parser.parse_args()
+
+    machine = LocalStateMachine.from_serverless('QiitaPublisher')
+
+    def run_sfn(article):
+        machine.execute({'article': article})
+        return [(h['state'], h['elapsed']) for h in machine.history]
+
+    def run_express(article):
+        started = time.perf_counter()
+        publish_article({'article': article}, {})
+        return [('PublishArticle', time.perf_counter() - started)]
+
+    with FakeQiitaServer(latency=args.latency) as server:
+        _run('sfn', server, args.articles, run_sfn)
+        _run('express', server, args.articles, run_express)
+
+
+if __name__ == '__main__':
+    main()
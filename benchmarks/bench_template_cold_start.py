@@ -0,0 +1,44 @@
+"""Cold-start time to first render, with and without precompiled templates
+
+Each sample is a fresh python process. Run `python -m qp.libs.template compile` first.
+
+usage: python -m benchmarks.bench_template_cold_start [--runs 10]
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+CHILD = '''
+import sys, json, time, pathlib
+started = time.perf_counter()
+import qp.libs.template as template
+imported = time.perf_counter()
+if sys.argv[1] == 'source':
+    template.COMPILED_DIR = pathlib.Path('/nonexistent')
+template.render_template('portfolio.jinja2', items=[], tags_count=[])
+rendered = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first_render': rendered - imported,
+                  'loader': type(template._get_env().loader).__name__}))
+'''
+
+
+def _sample(mode):
+    out = subprocess.run([sys.executable, '-c', CHILD, mode], check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    for mode in ('source', 'compiled'):
+        samples = [_sample(mode) for _ in range(args.runs)]
+        print(f"{mode:<9} loader={samples[0]['loader']:<15} "
+              f"import={statistics.median(s['import'] for s in samples) * 1000:7.1f} ms  "
+              f"first_render={statistics.median(s['first_render'] for s in samples) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
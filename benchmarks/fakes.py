@@ -0,0 +1,550 @@
+"""In-process stand-ins used by the benchmarks
+
+Nothing here talks to AWS or Qiita. The fakes mimic only the parts of
+qiita_v2 / boto3 that qp uses.
+"""
+import re
+import ssl
+import json
+import time
+import threading
+import subprocess
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_item(index: int, body_size: int=0) -> dict:
+    """Returns synthetic Qiita item dict
+
+    :param index: item index, used for id, title, likes_count and tags
+    :type index: int
+    :param body_size: length of markdown body. rendered_body is twice as large
+    :type body_size: int
+    """
+    return {
+        'id': f'{index:020x}',
+        'title': f'synthetic item {index}',
+        'url': f'https://qiita.com/example/items/{index:020x}',
+        'likes_count': (index * 7919) % 97,
+        'tags': [
+            {'name': f'tag{index % 13}', 'versions': []},
+            {'name': f'tag{index % 29}', 'versions': []},
+        ],
+        'created_at': '2020-06-26T10:00:00+09:00',
+        'updated_at': '2020-06-26T10:00:00+09:00',
+        'body': 'x' * body_size,
+        'rendered_body': '<p>' + 'x' * (body_size * 2) + '</p>',
+    }
+
+
+class FakeQiitaResponse(object):
+    """Subset of qiita_v2.response.QiitaResponse backed by raw bytes"""
+
+    def __init__(self, content: bytes, headers: dict):
+        self.content = content
+        self.headers = headers
+        self.links = {}
+        for link in headers.get('Link', '').split(','):
+            if not link.strip():
+                continue
+            url, rel = link.strip().split(';')
+            self.links[rel.strip()[5:-1]] = url.strip()[1:-1]
+
+    def to_json(self):
+        return json.loads(self.content)
+
+    @property
+    def link_first(self):
+        return self.links['first']
+
+    @property
+    def link_last(self):
+        return self.links['last']
+
+
+class FakeQiitaClient(object):
+    """Subset of qiita_v2.client.QiitaClient serving synthetic items
+
+    Page contents are generated on each request, so the account itself
+    does not take memory in the benchmarking process.
+    """
+
+    URL = 'https://qiita.com/api/v2/authenticated_user/items'
+
+    def __init__(self, total: int, body_size: int=0):
+        self.total = total
+        self.body_size = body_size
+        self.calls = 0
+
+    def get_authenticated_user_items(self, params=None, headers=None):
+        self.calls += 1
+        page = int(params.get('page', 1))
+        per_page = int(params.get('per_page', 20))
+        last_page = max(1, -(-self.total // per_page))
+        start = (page - 1) * per_page
+        items = [
+            make_item(i, self.body_size)
+            for i in range(start, min(self.total, start + per_page))
+        ]
+        link = ', '.join(
+            f'<{self.URL}?page={p}&per_page={per_page}>; rel="{rel}"'
+            for rel, p in [('first', 1), ('last', last_page)]
+        )
+        return FakeQiitaResponse(
+            content=json.dumps(items).encode('utf-8'),
+            headers={'Total-Count': str(self.total), 'Link': link}
+        )
+
+
+class FakeQiitaServer(object):
+    """Local HTTP(S) server speaking the subset of Qiita API v2 used by qp
+
+    - GET   /api/v2/authenticated_user/items  (Link, Total-Count headers)
+    - GET   /api/v2/items/<id>
+    - POST  /api/v2/items
+    - PATCH /api/v2/items/<id>
+
+    Every response carries Rate-Limit / Rate-Remaining / Rate-Reset headers.
+    Counts accepted connections (= TLS handshakes when certfile is given)
+    and requests per endpoint.
+
+    with FakeQiitaServer(total=1000) as server:
+        client = PooledQiitaClient(access_token='x', base_url=server.base_url)
+    """
+
+    def __init__(self, total: int=0, body_size: int=0, latency: float=0.0,
+                 rate_limit: int=1000, rate_window: int=3600, certfile: str=None):
+        self.total = total
+        self.body_size = body_size
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.certfile = certfile
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.calls = Counter()
+        self.created = {}
+        self._reset_rate()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _handler_for(self))
+        self.httpd.daemon_threads = True
+        if certfile is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        scheme = 'https' if self.certfile else 'http'
+        host = 'localhost' if self.certfile else '127.0.0.1'
+        return f'{scheme}://{host}:{self.httpd.server_address[1]}/api/v2'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.calls.clear()
+
+    def _reset_rate(self):
+        self.rate_remaining = self.rate_limit
+        self.rate_reset = int(time.time()) + self.rate_window
+
+    def _take_rate(self) -> bool:
+        with self.lock:
+            if time.time() >= self.rate_reset:
+                self._reset_rate()
+            if self.rate_remaining <= 0:
+                return False
+            self.rate_remaining -= 1
+            return True
+
+    def _rate_headers(self) -> dict:
+        return {
+            'Rate-Limit': str(self.rate_limit),
+            'Rate-Remaining': str(self.rate_remaining),
+            'Rate-Reset': str(self.rate_reset),
+        }
+
+    def _items_page(self, page: int, per_page: int):
+        last_page = max(1, -(-self.total // per_page))
+        start = (page - 1) * per_page
+        items = [
+            make_item(i, self.body_size)
+            for i in range(start, min(self.total, start + per_page))
+        ]
+        url = self.base_url + '/authenticated_user/items'
+        link = ', '.join(
+            f'<{url}?page={p}&per_page={per_page}>; rel="{rel}"'
+            for rel, p in [('first', 1), ('last', last_page)]
+        )
+        return items, {'Total-Count': str(self.total), 'Link': link}
+
+    def _item(self, item_id: str):
+        if item_id in self.created:
+            return self.created[item_id]
+        try:
+            index = int(item_id, 16)
+        except ValueError:
+            return None
+        if index >= self.total:
+            return None
+        return make_item(index, self.body_size)
+
+
+def _handler_for(server: FakeQiitaServer):
+    item_path = re.compile(r'^/api/v2/items/([0-9a-zA-Z]+)$')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with server.lock:
+                server.connections += 1
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path, _, query = self.path.partition('?')
+            if path == '/api/v2/authenticated_user/items':
+                params = dict(p.split('=', 1) for p in query.split('&') if '=' in p)
+                self._call('list_items', lambda: server._items_page(
+                    int(params.get('page', 1)), int(params.get('per_page', 20))))
+                return
+            m = item_path.match(path)
+            if m:
+                self._call('get_item', lambda: _found(server._item(m.group(1))))
+                return
+            self._send(404, {'message': 'Not found', 'type': 'not_found'})
+
+        def do_POST(self):
+            if self.path != '/api/v2/items':
+                self._send(404, {'message': 'Not found', 'type': 'not_found'})
+                return
+            params = self._body()
+
+            def create():
+                with server.lock:
+                    item_id = f'{len(server.created) + server.total:020x}'
+                    item = dict(params, id=item_id)
+                    server.created[item_id] = item
+                return item, {}
+            self._call('create_item', create, status=201)
+
+        def do_PATCH(self):
+            m = item_path.match(self.path)
+            if not m:
+                self._send(404, {'message': 'Not found', 'type': 'not_found'})
+                return
+            params = self._body()
+
+            def update():
+                item, headers = _found(server._item(m.group(1)))
+                if item is not None:
+                    item = dict(item, **params)
+                    with server.lock:
+                        server.created[item['id']] = item
+                return item, headers
+            self._call('update_item', update)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length', 0))
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def _call(self, name, func, status=200):
+            with server.lock:
+                server.calls[name] += 1
+            if server.latency:
+                time.sleep(server.latency)
+            if not server._take_rate():
+                self._send(403, {'message': 'Rate limit exceeded', 'type': 'rate_limit_exceeded'})
+                return
+            body, headers = func()
+            if body is None:
+                self._send(404, {'message': 'Not found', 'type': 'not_found'})
+                return
+            self._send(status, body, headers)
+
+        def _send(self, status, body, headers=None):
+            content = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(content)))
+            for k, v in dict(server._rate_headers(), **(headers or {})).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
+
+
+def _found(item):
+    return item, {}
+
+
+def make_self_signed_cert(path: str):
+    """Write a self-signed certificate and key for localhost into path (PEM). Requires openssl"""
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+        '-keyout', path, '-out', path, '-days', '1',
+        '-subj', '/CN=localhost',
+        '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+    ], check=True, capture_output=True)
+    return path
+
+
+class FakeTable(object):
+    """In-memory stand-in of boto3 DynamoDB Table (article table: article / parameter_type)
+
+    Supports the calls qp makes: get_item, put_item, delete_item, query / scan with
+    equality conditions, and update_item with 'set a=:x, ... remove b, ...'.
+    Values are stored as given (Decimal, Binary); bytes come back as Binary like boto3 returns them.
+    Items larger than 400 KB and Query filters on key attributes are rejected with
+    ValidationException like DynamoDB.
+    """
+
+    HASH_KEY = 'article'
+    RANGE_KEY = 'parameter_type'
+    MAX_ITEM_BYTES = 400 * 1024
+
+    def __init__(self):
+        self.items = {}
+        # hash key -> {range key: item}。Query を記事数に比例させないための索引
+        self.partitions = {}
+        self.lock = threading.Lock()
+        self.calls = Counter()
+
+    def _key(self, key):
+        return (key[self.HASH_KEY], key[self.RANGE_KEY])
+
+    def _store(self, key, item):
+        size = _item_size(item)
+        if size > self.MAX_ITEM_BYTES:
+            from botocore.exceptions import ClientError
+            raise ClientError({'Error': {
+                'Code': 'ValidationException',
+                'Message': f'Item size has exceeded the maximum allowed size ({size} bytes)'
+            }}, 'PutItem')
+        # boto3 は bytes を書き込んでも Binary で返す
+        from boto3.dynamodb.types import Binary
+        for name, value in item.items():
+            if isinstance(value, (bytes, bytearray)):
+                item[name] = Binary(value)
+        self.items[key] = item
+        self.partitions.setdefault(key[0], {})[key[1]] = item
+
+    def get_item(self, Key, **kwargs):
+        with self.lock:
+            self.calls['get_item'] += 1
+            item = self.items.get(self._key(Key))
+        return {'Item': dict(item)} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        with self.lock:
+            self.calls['put_item'] += 1
+            self._store(self._key(Item), dict(Item))
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        with self.lock:
+            self.calls['delete_item'] += 1
+            key = self._key(Key)
+            if self.items.pop(key, None) is not None:
+                del self.partitions[key[0]][key[1]]
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ReturnValues=None, **kwargs):
+        values = ExpressionAttributeValues or {}
+        with self.lock:
+            self.calls['update_item'] += 1
+            item = dict(self.items.get(self._key(Key), Key))
+            for action, body in _split_update_expression(UpdateExpression):
+                for part in body.split(','):
+                    part = part.strip()
+                    if action == 'set':
+                        name, placeholder = [p.strip() for p in part.split('=')]
+                        item[name] = values[placeholder]
+                    else:
+                        item.pop(part, None)
+            self._store(self._key(Key), item)
+        return {'Attributes': dict(item)}
+
+    def query(self, KeyConditionExpression, FilterExpression=None, ExclusiveStartKey=None, **kwargs):
+        if FilterExpression is not None:
+            keys = _condition_attributes(FilterExpression) & {self.HASH_KEY, self.RANGE_KEY}
+            if keys:
+                from botocore.exceptions import ClientError
+                raise ClientError({'Error': {
+                    'Code': 'ValidationException',
+                    'Message': f'Filter Expression can only contain non-primary key attributes: {sorted(keys)}'
+                }}, 'Query')
+        with self.lock:
+            self.calls['query'] += 1
+            expr = KeyConditionExpression.get_expression()
+            if expr['operator'] == '=' and expr['values'][0].name == self.HASH_KEY:
+                candidates = self.partitions.get(expr['values'][1], {}).values()
+            else:
+                candidates = self.items.values()
+            items = [
+                dict(i) for i in candidates
+                if _condition_matches(KeyConditionExpression, i)
+                and (FilterExpression is None or _condition_matches(FilterExpression, i))
+            ]
+        return {'Items': items, 'Count': len(items)}
+
+    def scan(self, FilterExpression=None, ExclusiveStartKey=None, **kwargs):
+        with self.lock:
+            self.calls['scan'] += 1
+            items = [
+                dict(i) for i in self.items.values()
+                if FilterExpression is None or _condition_matches(FilterExpression, i)
+            ]
+        return {'Items': items, 'Count': len(items)}
+
+
+def _item_size(value) -> int:
+    """Approximate DynamoDB item size: attribute names plus UTF-8 / binary / number lengths"""
+    from boto3.dynamodb.types import Binary
+    if isinstance(value, dict):
+        return sum(len(k.encode('utf-8')) + _item_size(v) for k, v in value.items()) + 3
+    if isinstance(value, (list, tuple, set)):
+        return sum(_item_size(v) for v in value) + 3
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, Binary):
+        return len(value.value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (bool, type(None))):
+        return 1
+    # 数値は有効数字 2 桁ごとに 1 バイト + 1
+    return len(str(value)) // 2 + 1
+
+
+def _split_update_expression(expression: str):
+    tokens = re.split(r'\b(set|remove)\b', expression, flags=re.IGNORECASE)
+    return [
+        (tokens[i].lower(), tokens[i + 1])
+        for i in range(1, len(tokens), 2)
+        if tokens[i + 1].strip()
+    ]
+
+
+def _condition_attributes(condition) -> set:
+    """Returns attribute names referenced by a boto3.dynamodb.conditions condition"""
+    from boto3.dynamodb.conditions import AttributeBase, ConditionBase
+    names = set()
+    for value in condition.get_expression()['values']:
+        if isinstance(value, AttributeBase):
+            names.add(value.name)
+        elif isinstance(value, ConditionBase):
+            names |= _condition_attributes(value)
+    return names
+
+
+def _condition_matches(condition, item) -> bool:
+    """Evaluate boto3.dynamodb.conditions equality / In / And conditions against item"""
+    expr = condition.get_expression()
+    if expr['operator'] == 'AND':
+        return all(_condition_matches(c, item) for c in expr['values'])
+    if expr['operator'] == '=':
+        attr, value = expr['values']
+        return item.get(attr.name) == value
+    if expr['operator'] == 'IN':
+        attr, values = expr['values']
+        return item.get(attr.name) in values
+    raise NotImplementedError(expr['operator'])
+
+
+class FakeSQSClient(object):
+    """In-memory stand-in of boto3 SQS client (send_message / delete_message)
+
+    Messages are kept per queue url; to_lambda_event() turns them into an
+    SQS Lambda event for jobconsumer.handler.
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.sequence = 0
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        with self.lock:
+            self.calls['send_message'] += 1
+            self.sequence += 1
+            message_id = f'message-{self.sequence}'
+            self.queues.setdefault(QueueUrl, []).append({
+                'messageId': message_id,
+                'receiptHandle': message_id,
+                'body': MessageBody,
+                'attributes': {'SentTimestamp': str(int(time.time() * 1000) + self.sequence)},
+            })
+        return {'MessageId': message_id}
+
+    def delete_message(self, QueueUrl, ReceiptHandle, **kwargs):
+        with self.lock:
+            self.calls['delete_message'] += 1
+            self.queues[QueueUrl] = [m for m in self.queues.get(QueueUrl, []) if m['receiptHandle'] != ReceiptHandle]
+        return {'ResponseMetadata': {'RequestId': ReceiptHandle}}
+
+    def to_lambda_event(self, queue_url=None, batch_size=10):
+        """Pop up to batch_size messages as an SQS Lambda event"""
+        with self.lock:
+            if queue_url is None:
+                queue_url = next(iter(self.queues), None)
+            messages = self.queues.get(queue_url, [])
+            batch, self.queues[queue_url] = messages[:batch_size], messages[batch_size:]
+        return {'Records': batch}
+
+
+class FakeResource(object):
+    """boto3.resource('dynamodb') stand-in returning the same FakeTable for every name"""
+
+    def __init__(self, table: FakeTable):
+        self.table = table
+
+    def Table(self, name):
+        return self.table
+
+
+def install(table: FakeTable=None, sqs: FakeSQSClient=None, qiita_client=None):
+    """Point qp's lazily created AWS / Qiita clients at the fakes
+
+    :param table: article table stand-in
+    :param sqs: SQS client stand-in
+    :param qiita_client: QiitaClient (e.g. PooledQiitaClient for FakeQiitaServer.base_url)
+    """
+    from qp import settings
+    from qp.libs import dynamodb, renderconfig, jobqueue, qiita
+    # EMF の行がベンチマークの出力に混ざらないようにする (qp.metrics.snapshot() は引き続き使える)
+    settings.METRICS_SINK = 'none'
+    if table is not None:
+        dynamodb.get_table = FakeResource(table).Table
+        renderconfig.invalidate_article_cache()
+    if sqs is not None:
+        jobqueue.sqs_client = sqs
+    if qiita_client is not None:
+        qiita.qiita = qiita_client
+        qiita.item_metadata.clear()
+
+
+def seed_article(table: FakeTable, article: str, template_variables: dict, tags=None):
+    """Put the template row the publisher expects"""
+    from qp.libs.codec import to_dynamodb
+    table.put_item(Item={
+        'article': article,
+        'parameter_type': 'template',
+        'template_name': 'portfolio.jinja2',
+        'tags': tags if tags is not None else [{'name': 'Qiita', 'versions': []}],
+        'template_variables': to_dynamodb(template_variables),
+    })
@@ -1,7 +1,11 @@
 import functools
 import json
 from qp import settings
-from qp.logs import get_logger
+from qp import metrics
+from qp.logs import get_logger, payload_sampling
+from qp.libs.qiita import request_deadline
+log = get_logger(__name__)
+
 
 def from_sfn(func):
     """Logging decorator. from_sfn decorator passes given both arguments and return values as it is
@@ -14,13 +18,13 @@ def from_sfn(func):
     """
     @functools.wraps(func)
     def wrapper(event, context):
-        log = get_logger(__name__)
-        log.info(event)
-        try:
-            result = func(event, context)
-        except Exception as e:
-            log.exception(e)
-            raise e
+        with payload_sampling(), metrics.invocation(func.__name__), request_deadline(context):
+            log.info(event)
+            try:
+                result = func(event, context)
+            except Exception as e:
+                log.exception(e)
+                raise e
         return result
     return wrapper
 
@@ -29,14 +33,14 @@ def from_sns(func):
     @functools.wraps(func)
     def wrapper(event, context):
         ret = []
-        log = get_logger(__name__)
         for record in event['Records']:
             message = json.loads(record['Sns']['Message'])
-            log.info(event)
-            try:
-                result = func(message, context)
-            except Exception as e:
-                log.exception(e)
-                raise e
+            with payload_sampling(), metrics.invocation(func.__name__):
+                log.info(event)
+                try:
+                    result = func(message, context)
+                except Exception as e:
+                    log.exception(e)
+                    raise e
         return result
     return wrapper
\ No newline at end of file
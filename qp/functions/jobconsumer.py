@@ -1,9 +1,13 @@
-import time
 from datetime import datetime
 import json
-from qp.libs.articlestore import put_article_template_variables
-from qp.libs.sfn import start_execution
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from qp.libs.articlestore import put_many_article_template_variables
+from qp.libs.sfn import start_execution, execution_name_for
+from qp.libs.qiita import request_deadline
+from qp.functions.sfn.publish import publish_article
 from qp import settings
+from qp import metrics
 
 from qp import logs
 log = logs.get_logger(__name__)
@@ -14,31 +18,156 @@ def handler(event, context):
 
     Consumer of qp.jobs.jobqueue, enqueue_template_variables()
 
+    バッチ内の全レコードを処理する。同じ記事のレコードは最新 (SentTimestamp) の template_variables だけを書き込み、
+    記事ごとに1回だけステートマシンを実行する。記事ごとの処理は並列に行う。
+    失敗したレコードは batchItemFailures として返し、そのレコードだけを SQS に再試行させる
+    (serverless.yml で functionResponseType: ReportBatchItemFailures を指定すること)
+
     :param event: SQS Event, Single record is a dict what has keys as follows; article, template_variables
     :type event: dict
+    :return: {batchItemFailures: [{itemIdentifier: messageId}]}
+    :rtype: dict
     """
-    for record in event['Records']:
-        item = json.loads(record['body'])
-        article = item['article']
-        template_variables = item['template_variables']
-        updated_item = put_article_template_variables(
-            article=article,
-            template_variables=template_variables
-        )
-        log.info(updated_item)
+    with logs.payload_sampling(), metrics.invocation('jobconsumer'), request_deadline(context):
+        return _handle(event)
+
+
+def _handle(event):
+    failures = []
+    groups = OrderedDict()
+    for index, record in enumerate(event['Records']):
+        try:
+            item = json.loads(record['body'])
+            article = item['article']
+            template_variables = item['template_variables']
+        except (ValueError, KeyError, TypeError) as e:
+            log.error({
+                'event': 'invalid message',
+                'message_id': record.get('messageId'),
+                'error': str(e)
+            })
+            failures.append(record['messageId'])
+            continue
+        sent_at = int(record.get('attributes', {}).get('SentTimestamp', 0))
+        groups.setdefault(article, []).append(((sent_at, index), record['messageId'], template_variables))
+
+    if groups:
+        failures.extend(_process_articles(groups))
+
+    log.info({
+        'event': 'batch processed',
+        'records': len(event['Records']),
+        'articles': len(groups),
+        'failures': len(failures)
+    })
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': message_id}
+            for message_id in failures
+        ]
+    }
+
+
+def _process_articles(groups):
+    """Returns message ids which failed
+
+    記事ごとに最新のメッセージだけをまとめて書き込み、書き込めた記事のステートマシンを並列に実行する。
+    古いメッセージは最新メッセージの結果に従う (成功すれば全て削除、失敗すれば全て再試行)
+
+    :param groups: {article: [((sent_at, index), message_id, template_variables)]}
+    :type groups: OrderedDict
+    :rtype: list
+    """
+    newest = []
+    for article, messages in groups.items():
+        _, message_id, template_variables = max(messages, key=lambda m: m[0])
+        if len(messages) > 1:
+            log.info({
+                'event': 'messages coalesced',
+                'article': article,
+                'messages': len(messages),
+                'message_id': message_id
+            })
+        newest.append({
+            'article': article,
+            'message_id': message_id,
+            'template_variables': template_variables
+        })
+
+    results = put_many_article_template_variables(newest, return_exceptions=True)
+    written = []
+    failed_articles = []
+    for update, result in zip(newest, results):
+        if isinstance(result, Exception):
+            failed_articles.append(update['article'])
+        else:
+            log.info({
+                'event': 'template variables updated',
+                'article': update['article'],
+                'item': result
+            })
+            written.append(update)
+
+    if written:
+        max_workers = min(settings.JOB_CONSUMER_MAX_WORKERS, len(written))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for update, ok in zip(written, executor.map(logs.with_payload_sampling(_publish), written)):
+                if not ok:
+                    failed_articles.append(update['article'])
 
+    return [
+        message_id
+        for article in failed_articles
+        for (_, message_id, _) in groups[article]
+    ]
+
+
+def _publish(update):
+    """Start publisher state machine, or run it in process if PUBLISHER_MODE is 'express'. Returns False if failed"""
+    article = update['article']
+    if settings.PUBLISHER_MODE == 'express':
+        try:
+            result = publish_article({'article': article}, {})
+        except Exception as e:
+            log.exception({
+                'event': 'failed to publish article',
+                'article': article,
+                'message_id': update['message_id'],
+                'error': str(e)
+            })
+            return False
+        log.info({
+            'event': 'article published',
+            'article': article,
+            'result': result
+        })
+        return True
+
+    # 最新メッセージの id を使うので、同じバッチが再配信されても二重に実行されない
+    execution_name = execution_name_for(article, update['message_id'])
+    try:
         resp = start_execution(
             name=settings.PUBLISHER_STATEMACHINE_NAME,
             params=json.dumps({
                 'article': article
-            })
+            }),
+            execution_name=execution_name
         )
-        log.info({
-            'event': 'statemachine executed',
-            'name': settings.PUBLISHER_STATEMACHINE_NAME,
-            'params': {
-                'article': article
-            },
-            'execution_response': resp
+    except Exception as e:
+        log.exception({
+            'event': 'failed to start statemachine',
+            'article': article,
+            'message_id': update['message_id'],
+            'error': str(e)
         })
-        return updated_item
\ No newline at end of file
+        return False
+    log.info({
+        'event': 'statemachine executed' if resp is not None else 'statemachine execution coalesced',
+        'name': settings.PUBLISHER_STATEMACHINE_NAME,
+        'execution_name': execution_name,
+        'params': {
+            'article': article
+        },
+        'execution_response': resp
+    })
+    return True
@@ -1,8 +1,11 @@
 import json
-from collections import Counter
-from qp.libs.qiita import create_qiita
+import time
+from qp.libs.qiita import create_qiita, request_deadline
+from qp.libs.snapshot import SNAPSHOT_FIELDS, SnapshotUpdater, compact_item, create_snapshot_store
+from qp.libs.aggregate import Aggregator, TopItems, TopCounts
 from qp.libs.jobqueue import enqueue_template_variables
 from qp import settings
+from qp import metrics
 
 from qp import logs
 log = logs.get_logger(__name__)
@@ -10,41 +13,50 @@ log = logs.get_logger(__name__)
 
 # 投稿記事を特定するための名前
 ARTICLE_NAME = 'Qiita Contributions Portfolio (Auto Generated)'
-# タグ出現頻度の上位N件
-MAX_FREQUENT_TAGS = 10
-# Like 数の上位N件
-MAX_LIKED_ITEMS = 5
+# 集計に使う item のキー (body, rendered_body は取得時点で捨てる)
+ITEM_FIELDS = ['title', 'url', 'created_at', 'likes_count', 'tags']
+# template_variables に入れるランキング。item は snapshot.compact_item() の形で渡される
+# 年別・月別などを加える場合は group に qp.libs.aggregate.year_of / month_of を指定する
+METRICS = [
+    # Like 数の上位5件
+    TopItems(
+        'items',
+        k=5,
+        score=lambda item: item['likes_count'],
+        value=lambda item: dict(name=item['title'], link=item['url'], likes=item['likes_count'])
+    ),
+    # タグ出現頻度の上位10件
+    TopCounts(
+        'tags_count',
+        k=10,
+        keys=lambda item: item['tags'],
+        value=lambda name, count: dict(name=name, count=count)
+    ),
+]
 
 
 def handler(event, context):
+    with metrics.invocation('contribution_summarize'), request_deadline(context):
+        return _summarize(event)
+
+
+def _summarize(event):
     qiita = create_qiita()
-    items = qiita.list_own_items()
-
-    # Get frequent tags
-    item_tags = [item['tags'] for item in items]
-    tag_counts = Counter()
-    for item_tags in item_tags:
-        tag_names = [tag['name'] for tag in item_tags]
-        tag_counts.update(tag_names)
-    frequent_tags = _get_most_frequents(tag_counts, n=MAX_FREQUENT_TAGS)
-    frequent_tags = [
-        dict(name=name, count=count)
-        for (name, count) in frequent_tags
-    ]
-
-    # Get most liked items
-    items_sorted_by_liked = sorted(items, key=lambda i: i.get('likes_count', 0), reverse=True)
-    liked_items = [
-        dict(name=item['title'], link=item['url'], likes=item['likes_count'])
-        for item in items_sorted_by_liked[:MAX_LIKED_ITEMS]
-    ]
-
-    # print(json.dumps(frequent_tags, indent=2))
-    # print(json.dumps(liked_items, indent=4))
-    template_vars = {
-        'items': liked_items,
-        'tags_count': frequent_tags
-    }
+    store = create_snapshot_store(ARTICLE_NAME)
+
+    # すべてのランキングを 1 回の走査で求める
+    aggregator = Aggregator(METRICS)
+    if store is None:
+        # ページ単位で取得しながら集計する (全件をメモリに載せない)
+        for item in qiita.iter_own_items(fields=ITEM_FIELDS):
+            aggregator.feed(compact_item(item))
+    else:
+        # 取得は前回のスナップショットとの差分だけ。タグ数を含むランキングはスナップショットの全 item から求める
+        snapshot = _update_snapshot(qiita, store, full=bool((event or {}).get('full', False)))
+        for entry in snapshot['items'].values():
+            aggregator.feed(entry)
+
+    template_vars = aggregator.results()
     enqueue_template_variables(
         article_name=ARTICLE_NAME,
         template_variables=template_vars
@@ -52,9 +64,42 @@ def handler(event, context):
     return template_vars
 
 
-def _get_most_frequents(counter, n):
-    most_frequent_keys = sorted(counter, key=lambda k: counter[k], reverse=True)
-    return [(k, counter[k]) for k in most_frequent_keys[:n]]
+def _update_snapshot(qiita, store, full=False):
+    """新しい順にページを取得し、変更のない item だけのページに到達した時点で打ち切る
+
+    authenticated_user/items は作成日時の新しい順に並ぶ (更新日時順ではない) ため、差分取得で拾えるのは
+    新しく投稿された item と、先頭側のページにある item の変更だけである。
+    古い item のタイトルやタグの編集、Like 数の変化、削除は次の全件取得まで反映されない。
+    スナップショットが無い場合と SNAPSHOT_FULL_CRAWL_INTERVAL を過ぎた場合は全件取得する
+
+    :param qiita: Qiita
+    :param store: snapshot store
+    :param full: force full crawl, defaults to False
+    :type full: bool, optional
+    :return: updated snapshot
+    :rtype: dict
+    """
+    snapshot = store.load()
+    if time.time() - snapshot['crawled_at'] >= settings.SNAPSHOT_FULL_CRAWL_INTERVAL:
+        full = True
+    updater = SnapshotUpdater(snapshot, full=full)
+    pages = 0
+    # 途中で打ち切るため先読みはしない
+    for page_items in qiita.iter_own_item_pages(max_workers=1, fields=SNAPSHOT_FIELDS):
+        pages += 1
+        changed = [updater.apply(item) for item in page_items]
+        if not full and not any(changed):
+            break
+    snapshot = updater.finish()
+    store.save(snapshot)
+    log.info({
+        'event': 'snapshot updated',
+        'full': full,
+        'pages': pages,
+        'changed': updater.changed,
+        'items': len(snapshot['items'])
+    })
+    return snapshot
 
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from qp.libs.renderconfig import list_render_configs_with_publish_status
+from qp.functions.sfn.publish import publish_render_config
+from qp.libs.qiita import request_deadline
+from qp import settings
+from qp import metrics
+
+from qp import logs
+log = logs.get_logger(__name__)
+
+
+def handler(event, context):
+    """テーブルの全記事 (template 行) をレンダリングし、Qiita に作成 / 更新する
+
+    記事ごとにステートマシンを実行する代わりに、このプロセス内で BATCH_PUBLISH_MAX_WORKERS 並列に公開する。
+    Qiita API のレート制限は qp.libs.qiita の共有 RateLimiter が守る。
+
+    :param event: {articles<list>, optional} 対象の記事名。省略時は全記事
+    :type event: dict
+    :return: {summary<dict>, results<list of {article, result, item_id, elapsed, error}>}
+    :rtype: dict
+    """
+    with logs.payload_sampling(), metrics.invocation('republish_all'), request_deadline(context):
+        return _republish(event)
+
+
+def _republish(event):
+    targets = (event or {}).get('articles')
+    configs = list_render_configs_with_publish_status()
+    if targets:
+        configs = [c for c in configs if c['article'] in targets]
+
+    results = []
+    if configs:
+        max_workers = min(settings.BATCH_PUBLISH_MAX_WORKERS, len(configs))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(logs.with_payload_sampling(_publish), configs))
+
+    summary = {}
+    for r in results:
+        summary[r['result']] = summary.get(r['result'], 0) + 1
+    log.info({
+        'event': 'republished all articles',
+        'articles': len(results),
+        'summary': summary
+    })
+    return {
+        'summary': summary,
+        'results': results
+    }
+
+
+def _publish(config):
+    article = config['article']
+    started = time.perf_counter()
+    try:
+        output = publish_render_config(config, {})
+    except Exception as e:
+        log.exception({
+            'event': 'failed to publish article',
+            'article': article,
+            'error': str(e)
+        })
+        return {
+            'article': article,
+            'result': 'failed',
+            'item_id': config['publish_status']['item_id'],
+            'elapsed': time.perf_counter() - started,
+            'error': str(e)
+        }
+    if 'result' in output:
+        # UpdateItem: {item_id, result<'updated'|'unchanged'>}
+        result, item_id = output['result'], output['item_id']
+    else:
+        # CreateItem -> UpdatePublishStatus
+        result, item_id = 'created', output['item_id']
+    return {
+        'article': article,
+        'result': result,
+        'item_id': item_id,
+        'elapsed': time.perf_counter() - started,
+        'error': None
+    }
+
+
+if __name__ == '__main__':
+    print(json.dumps(handler({}, {}), indent=4, ensure_ascii=False))
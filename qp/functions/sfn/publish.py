@@ -1,9 +1,10 @@
 from qp import deco
 from qp.error import QpError
 from qp.libs.qiita import create_qiita
-from qp.libs.template import render_template
+from qp.libs.template import render_template, content_digest
 from qp.libs.renderconfig import (
     find_render_config_by_article,
+    find_render_config_with_publish_status,
     get_publish_status,
     put_published_status
 )
@@ -28,6 +29,20 @@ def find_template_by_article(data, context={}):
     return find_render_config_by_article(data['article'])
 
 
+@deco.from_sfn
+def find_template_with_publish_status(data, context={}):
+    """記事のレンダリングに使用するパラメータと公開状態を1回の Query で返す
+
+    FindTemplateByArticle と GetItemExists をまとめたもの
+
+    :param data: {article<str>}
+    :type data: dict
+    :return: {article<str>, template_name<str>, template_variables<dict>, tags<list>, publish_status<dict>}
+    :rtype: dict
+    """
+    return find_render_config_with_publish_status(data['article'])
+
+
 @deco.from_sfn
 def get_item_exists(data, context):
     """
@@ -40,34 +55,125 @@ def get_item_exists(data, context):
 
 @deco.from_sfn
 def create_item(data, context):
+    return _create_item(data, _render_content(data))
+
+
+@deco.from_sfn
+def update_item(data, context):
+    """Update published item. 前回公開時と本文・タイトル・タグが同じ場合は Qiita API を呼ばない
+
+    ハッシュを持たない公開状態 (ハッシュの導入前に公開した記事) は常に更新する
+
+    :return: {item_id<str>, result<'updated'|'unchanged'>}
+    :rtype: dict
+    """
+    return _update_item(data)
+
+
+@deco.from_sfn
+def update_publish_status(data, context):
+    # CreateItem の出力は item id のみなので、公開した内容のハッシュは再レンダリングして求める
+    content_hash = _content_hash(data, _render_content(data))
+    return _update_publish_status(data, content_hash)
+
+
+@deco.from_sfn
+def publish_article(data, context={}):
+    """QiitaPublisher ステートマシンと同じ処理を1回の呼び出しで行う (express mode)
+
+    FindTemplateWithPublishStatus -> IsItemExists? -> UpdateItem | CreateItem -> UpdatePublishStatus
+
+    :param data: {article<str>}
+    :type data: dict
+    :return: output of the last step, same as the state machine execution output
+    """
+    data = find_render_config_with_publish_status(data['article'])
+    return publish_render_config(data, context)
+
+
+def publish_render_config(data, context={}):
+    """publish_article() の FindTemplateWithPublishStatus 以降の処理
+
+    各ステップの handler (deco.from_sfn) は入力をログに出すので、ここからはデコレートしていない関数を呼び、
+    設定のログは1回にする
+
+    :param data: output of find_template_with_publish_status
+    :type data: dict
+    :return: UpdateItem output ({item_id, result}) or UpdatePublishStatus output (data with item_id)
+    """
     log.info({
-        'event': 'Create item',
+        'event': 'Publish render config',
         'data': data
     })
-    qiita = create_qiita()
-    content = render_template(
-        template_name=data['template_name'],
-        **data['template_variables']
-    )
+    # IsItemExists? (Choice): $.publish_status.is_published == true なら UpdateItem, それ以外は CreateItem
+    if data['publish_status']['is_published'] is True:
+        return _update_item(data)
+    # 同じプロセス内なので、CreateItem でレンダリングした内容のハッシュをそのまま使う
+    content = _render_content(data)
+    data['item_id'] = _create_item(data, content)
+    return _update_publish_status(data, _content_hash(data, content))
+
+
+def _create_item(data, content: str):
     log.info({
-        'event': 'Content has rendered',
-        'content': content
+        'event': 'Create item',
+        'article': data['article']
     })
+    qiita = create_qiita()
     result = qiita.create_item(
         title=data['article'],
         tags=data['tags'],
         md_content=content
     )
     return result
-    
 
-@deco.from_sfn
-def update_item(data, context):
+
+def _update_item(data):
+    item_id = data['publish_status']['item_id']
     log.info({
         'event': 'Update item',
-        'data': data
+        'article': data['article'],
+        'item_id': item_id
     })
+    content = _render_content(data)
+    content_hash = _content_hash(data, content)
+    if content_hash == data['publish_status'].get('content_hash'):
+        log.info({
+            'event': 'Content is unchanged',
+            'item_id': item_id,
+            'content_hash': content_hash
+        })
+        return {
+            'item_id': item_id,
+            'result': 'unchanged'
+        }
+
     qiita = create_qiita()
+    # title と tags は FindTemplateByArticle の出力を使い、get_item の往復を省く
+    result = qiita.update_item(
+        id=item_id,
+        md_content=content,
+        title=data['article'],
+        tags=data['tags']
+    )
+    put_published_status(data['article'], result, content_hash=content_hash)
+    return {
+        'item_id': result,
+        'result': 'updated'
+    }
+
+
+def _update_publish_status(data, content_hash: str):
+    log.info({
+        'event': 'Update publish status',
+        'article': data['article'],
+        'item_id': data['item_id']
+    })
+    put_published_status(data['article'], data['item_id'], content_hash=content_hash)
+    return data
+
+
+def _render_content(data):
     content = render_template(
         template_name=data['template_name'],
         **data['template_variables']
@@ -76,15 +182,9 @@ def update_item(data, context):
         'event': 'Content has rendered',
         'content': content
     })
-    result = qiita.update_item(
-        id=data['publish_status']['item_id'],
-        md_content=content
-    )
-    return result
+    return content
 
 
-@deco.from_sfn
-def update_publish_status(data, context):
-    log.info(f'update_publish_status {data}')
-    put_published_status(data['article'], data['item_id'])
-    return data
+def _content_hash(data, content: str) -> str:
+    """公開する内容のハッシュ。本文に加えて、Qiita に送るタイトル (記事名) とタグも含める"""
+    return content_digest(content, title=data['article'], tags=data['tags'])
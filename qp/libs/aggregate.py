@@ -0,0 +1,217 @@
+"""Streaming top-K aggregation over Qiita items
+
+item を 1 回だけ走査して、定義したランキングをすべて求める。ランキングごとに全件をソートしない。
+
+- TopItems:  item ごとの score (Like 数, ストック数など) の上位 k 件。heap で O(n log k)
+- TopCounts: item から取り出したキー (タグ名など) の出現回数の上位 k 件。数えるのは O(n)、
+  最後に出現したキーの数 m に対して O(m log k) で選ぶ
+
+どちらも group を指定すると、グループ (年, 月など) ごとの上位 k 件を求める。
+同じ score の場合は先に現れたものを優先する (sorted(..., reverse=True) の安定ソートと同じ順序) ので、
+入力の順序が同じなら結果は常に同じになる。
+
+    aggregator = Aggregator([
+        TopItems('items', k=5, score=lambda item: item['likes_count']),
+        TopCounts('tags_count', k=10, keys=lambda item: item['tags']),
+        TopCounts('tags_by_year', k=3, keys=lambda item: item['tags'], group=year_of),
+    ])
+    for item in items:
+        aggregator.feed(item)
+    aggregator.results()
+    # {'items': [...], 'tags_count': [...], 'tags_by_year': {'2020': [...], ...}}
+"""
+import heapq
+
+
+class TopK(object):
+    """score の大きい順に k 件を保持する (min-heap)
+
+    同じ score の場合は先に push したものを優先する
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        # (score, -order, value)。order は一意なので value 同士は比較されない
+        self.heap = []
+        self.order = 0
+
+    def push(self, score, value):
+        """O(log k)
+
+        :param score: comparable score
+        :param value: any value kept with the score
+        """
+        order = self.order
+        self.order = order + 1
+        heap = self.heap
+        if len(heap) < self.k:
+            heapq.heappush(heap, (score, -order, value))
+        # 後から来たものは同じ score では勝てないので、最小値より大きい場合だけ入れ替える (大半の item はここで捨てる)
+        elif self.k > 0 and score > heap[0][0]:
+            heapq.heapreplace(heap, (score, -order, value))
+
+    def result(self) -> list:
+        """Returns list of (score, value) in descending order of score"""
+        return [
+            (score, value)
+            for score, _, value in sorted(self.heap, key=lambda e: e[:2], reverse=True)
+        ]
+
+
+class TopItems(object):
+    """item ごとの score の上位 k 件
+
+    :param name: key of the result
+    :type name: str
+    :param k: number of items to keep
+    :type k: int
+    :param score: function(item) -> comparable score
+    :type score: function
+    :param value: function(item) -> output, defaults to the item itself
+    :type value: function, optional
+    :param group: function(item) -> group key (None の item は数えない), defaults to None (no grouping)
+    :type group: function, optional
+    """
+
+    def __init__(self, name: str, k: int, score, value=None, group=None):
+        self.name = name
+        self.k = k
+        self.score = score
+        self.value = value
+        self.group = group
+
+    def accumulator(self):
+        return TopItemsAccumulator(self)
+
+
+class TopItemsAccumulator(object):
+    def __init__(self, definition: TopItems):
+        self.definition = definition
+        self.score = definition.score
+        self.group = definition.group
+        # group key -> TopK (グループは最初に現れた順)
+        self.groups = {}
+
+    def feed(self, item: dict):
+        group = None
+        if self.group is not None:
+            group = self.group(item)
+            if group is None:
+                return
+        top = self.groups.get(group)
+        if top is None:
+            top = self.groups[group] = TopK(self.definition.k)
+        # value() は残った k 件にだけ適用する
+        top.push(self.score(item), item)
+
+    def result(self):
+        value = self.definition.value or (lambda item: item)
+        results = {
+            group: [value(item) for _, item in top.result()]
+            for group, top in self.groups.items()
+        }
+        return _ungroup(self.definition, results)
+
+
+class TopCounts(object):
+    """item から取り出したキーの出現回数の上位 k 件
+
+    :param name: key of the result
+    :type name: str
+    :param k: number of keys to keep
+    :type k: int
+    :param keys: function(item) -> iterable of keys (e.g. tag names)
+    :type keys: function
+    :param value: function(key, count) -> output, defaults to (key, count)
+    :type value: function, optional
+    :param group: function(item) -> group key (None の item は数えない), defaults to None (no grouping)
+    :type group: function, optional
+    """
+
+    def __init__(self, name: str, k: int, keys, value=None, group=None):
+        self.name = name
+        self.k = k
+        self.keys = keys
+        self.value = value
+        self.group = group
+
+    def accumulator(self):
+        return TopCountsAccumulator(self)
+
+
+class TopCountsAccumulator(object):
+    def __init__(self, definition: TopCounts):
+        self.definition = definition
+        self.keys = definition.keys
+        self.group = definition.group
+        # group key -> {key: count} (キーは最初に現れた順)
+        self.groups = {}
+
+    def feed(self, item: dict):
+        group = None
+        if self.group is not None:
+            group = self.group(item)
+            if group is None:
+                return
+        counts = self.groups.get(group)
+        if counts is None:
+            counts = self.groups[group] = {}
+        # Counter.update() は引数の型判定が重いので dict で数える
+        for key in self.keys(item):
+            counts[key] = counts.get(key, 0) + 1
+
+    def result(self):
+        value = self.definition.value or (lambda key, count: (key, count))
+        results = {}
+        for group, counts in self.groups.items():
+            top = TopK(self.definition.k)
+            for key, count in counts.items():
+                top.push(count, key)
+            results[group] = [value(key, count) for count, key in top.result()]
+        return _ungroup(self.definition, results)
+
+
+class Aggregator(object):
+    """Feed items once, get every ranking
+
+    :param definitions: list of TopItems / TopCounts
+    :type definitions: list
+    """
+
+    def __init__(self, definitions: list):
+        self.accumulators = [(d.name, d.accumulator()) for d in definitions]
+        self.feeds = [accumulator.feed for _, accumulator in self.accumulators]
+
+    def feed(self, item: dict):
+        for feed in self.feeds:
+            feed(item)
+
+    def results(self) -> dict:
+        """Returns {name: list} ({name: {group: list}} for grouped definitions)"""
+        return {name: accumulator.result() for name, accumulator in self.accumulators}
+
+
+def aggregate(items, definitions: list) -> dict:
+    """Aggregator.feed() every item and return Aggregator.results()"""
+    aggregator = Aggregator(definitions)
+    for item in items:
+        aggregator.feed(item)
+    return aggregator.results()
+
+
+def year_of(item: dict):
+    """group function: '2020-01-23T12:34:56+09:00' -> '2020'"""
+    created_at = item.get('created_at')
+    return created_at[:4] if created_at else None
+
+
+def month_of(item: dict):
+    """group function: '2020-01-23T12:34:56+09:00' -> '2020-01'"""
+    created_at = item.get('created_at')
+    return created_at[:7] if created_at else None
+
+
+def _ungroup(definition, results: dict):
+    if definition.group is None:
+        return results.get(None, [])
+    return results
@@ -1,69 +1,99 @@
 import json
 import time
 from decimal import Decimal
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from qp import settings
+from qp import metrics
+from qp.libs import dynamodb
+from qp.libs.codec import to_dynamodb
+from qp.libs.varstore import encode_template_variables, ATTRIBUTES as VARIABLE_ATTRIBUTES
+from qp.libs.renderconfig import invalidate_article_cache
 
-from qp.logs import get_logger
+from qp.logs import get_logger, with_payload_sampling
 log = get_logger(__name__)
 
 
-dynamodb_resource = None
-
-
-def _get_resource():
-    global dynamodb_resource
-    if dynamodb_resource is None:
-        dynamodb_resource = boto3.resource('dynamodb')
-    return dynamodb_resource
-
-
 def get_table(name):
-    return _get_resource().Table(name)
+    """Returns qp.libs.dynamodb.Table shared by every thread (ThreadPoolExecutor のスレッドからも使える)"""
+    return dynamodb.get_table(name)
 
 
 def flat_dict_convert_number_to_decimal(d):
     """
-    :param tv: flat dict
+    ネストした値も変換する。qp.libs.codec.to_dynamodb を参照
+
+    :param tv: dict
     :type tv: dict
     """
-    result = {}
-    for k, v in d.items():
-        if type(v) == int or type(v) == float:
-            v = Decimal(v)
-        result.setdefault(k, v)
-    return result
+    return to_dynamodb(d)
 
 
 def put_article_template_variables(article, template_variables):
-    """[summary]
+    """Update template_variables of the article's template row
 
-    :param article: [description]
-    :type article: [type]
-    :param template_variables: [description]
-    :type template_variables: [type]
+    :param article: article name
+    :type article: str
+    :param template_variables: template variables
+    :type template_variables: dict
+    :return: updated item
+    :rtype: dict
     """
     table = get_table(settings.ARTICLE_TABLE_NAME)
-    # resp = table.get_item(Key={
-    #     'article': article,
-    #     'parameter_type': 'template'
-    # })
-    # item = resp['Item']
-    # item
-    items = table.scan()
+    # 大きい場合は圧縮またはオブジェクトストアに逃がす。他の形式の属性は消す
+    attribute, tvars = encode_template_variables(template_variables)
+    removes = ', '.join(a for a in VARIABLE_ATTRIBUTES if a != attribute)
+    with metrics.span('dynamodb.update_item'):
+        updated_result = table.update_item(
+            Key={
+                'article': article,
+                'parameter_type': 'template'
+            },
+            UpdateExpression=f"set {attribute}=:tv, last_updated=:ts remove {removes}",
+            ExpressionAttributeValues={
+                ':tv': tvars,
+                ':ts': Decimal(int(time.time()))
+            },
+            ReturnValues="ALL_NEW"
+        )
+    invalidate_article_cache(article)
+    return updated_result['Attributes']
+
+
+def put_many_article_template_variables(updates, max_workers=None, return_exceptions=False):
+    """Update template_variables of many articles with bounded concurrency
+
+    BatchWriteItem は行全体を置き換えてしまう (template_name, tags が消える) ため、
+    UpdateItem を max_workers 並列で発行する。
+
+    :param updates: list of {article<str>, template_variables<dict>}
+    :type updates: list
+    :param max_workers: number of concurrent requests, defaults to settings.ARTICLE_STORE_MAX_WORKERS
+    :type max_workers: int, optional
+    :param return_exceptions: put exceptions into the result instead of raising, defaults to False
+    :type return_exceptions: bool, optional
+    :return: updated items (or exceptions) in the order of updates
+    :rtype: list
+    """
+    if max_workers is None:
+        max_workers = settings.ARTICLE_STORE_MAX_WORKERS
+
+    def put(update):
+        try:
+            return put_article_template_variables(
+                article=update['article'],
+                template_variables=update['template_variables']
+            )
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            log.error({
+                'event': 'put_article_template_variables failed',
+                'article': update['article'],
+                'error': str(e)
+            })
+            return e
 
-    tvars = flat_dict_convert_number_to_decimal(template_variables)
-    updated_result = table.update_item(
-        Key={
-            'article': article,
-            'parameter_type': 'template'
-        },
-        UpdateExpression="set template_variables=:tv, last_updated=:ts",
-        ExpressionAttributeValues={
-            ':tv': tvars,
-            ':ts': Decimal(int(time.time()))
-        },
-        ReturnValues="ALL_NEW"
-    )
-    
-    return updated_result['Attributes']
\ No newline at end of file
+    if not updates:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(updates)))) as executor:
+        return list(executor.map(with_payload_sampling(put), updates))
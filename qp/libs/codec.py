@@ -0,0 +1,76 @@
+"""DynamoDB <-> Python value conversion
+
+boto3 の resource は数値を Decimal で返し、float を受け付けない。
+JSON の往復をせずに、ネストした dict / list を1回の走査で変換する。
+"""
+from decimal import Decimal
+
+
+# 変換不要な型。これらはそのまま返す
+_SCALARS = frozenset([str, int, float, bool, type(None), bytes, bytearray])
+
+
+def from_dynamodb(value):
+    """Convert Decimal in value (recursive) to int or float
+
+    整数値の Decimal は int に、それ以外は float にする (DecimalEncoder と同じ規則)。
+    変換の必要がない dict / list は新しく作らずにそのまま返す。
+
+    :param value: value returned by boto3 DynamoDB resource
+    :return: value without Decimal
+    """
+    t = type(value)
+    if t in _SCALARS:
+        return value
+    if t is Decimal:
+        if value % 1 == 0:
+            return int(value)
+        return float(value)
+    if t is dict:
+        result = None
+        for k, v in value.items():
+            if type(v) in _SCALARS:
+                continue
+            converted = from_dynamodb(v)
+            if converted is not v:
+                if result is None:
+                    result = dict(value)
+                result[k] = converted
+        return value if result is None else result
+    if t is list or t is tuple:
+        result = None
+        for i, v in enumerate(value):
+            if type(v) in _SCALARS:
+                continue
+            converted = from_dynamodb(v)
+            if converted is not v:
+                if result is None:
+                    result = list(value)
+                result[i] = converted
+        return value if result is None else result
+    if t is set:
+        return {from_dynamodb(v) for v in value}
+    return value
+
+
+def to_dynamodb(value):
+    """Convert int / float in value (recursive) to Decimal
+
+    float は Decimal(str(f)) で変換する (Decimal(f) は 2進数の誤差をそのまま持ち込むため)。
+    bool は int の派生だが DynamoDB の BOOL として扱うので変換しない。
+
+    :param value: python value
+    :return: value which boto3 DynamoDB resource accepts
+    """
+    t = type(value)
+    if t is int:
+        return Decimal(value)
+    if t is float:
+        return Decimal(str(value))
+    if t is dict:
+        return {k: to_dynamodb(v) for k, v in value.items()}
+    if t is list or t is tuple:
+        return [to_dynamodb(v) for v in value]
+    if t is set:
+        return {to_dynamodb(v) for v in value}
+    return value
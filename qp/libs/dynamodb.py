@@ -0,0 +1,129 @@
+"""Thread-safe DynamoDB table access over one shared low-level client
+
+boto3 の resource はスレッドセーフではないが、client はスレッドセーフなので、プロセスで1つの client を
+全スレッドで共有する。Table は resource の Table と同じ引数・戻り値 (数値は Decimal, バイナリは Binary,
+条件は boto3.dynamodb.conditions) の get_item / put_item / delete_item / update_item / query / scan を提供する。
+
+ThreadPoolExecutor のスレッドは呼び出しごとに作り直されるため、スレッドごとに resource を作ると
+Lambda の warm start でも毎回 client とコネクションプールを作り直すことになる。
+"""
+import threading
+from qp import settings
+
+client = None
+# table name -> Table
+tables = {}
+lock = threading.Lock()
+
+
+def _get_client():
+    global client
+    if client is None:
+        with lock:
+            if client is None:
+                import boto3
+                from botocore.config import Config
+                client = boto3.client('dynamodb', config=Config(
+                    max_pool_connections=max(
+                        10,
+                        settings.ARTICLE_STORE_MAX_WORKERS,
+                        settings.JOB_CONSUMER_MAX_WORKERS,
+                        settings.BATCH_PUBLISH_MAX_WORKERS
+                    )
+                ))
+    return client
+
+
+def get_table(name: str):
+    """Returns Table shared by every thread
+
+    :param name: table name
+    :type name: str
+    :rtype: Table
+    """
+    table = tables.get(name)
+    if table is None:
+        with lock:
+            table = tables.setdefault(name, Table(name))
+    return table
+
+
+class Table(object):
+    """boto3 resource の Table と同じ呼び出し方で、共有の client にリクエストする
+
+    :param name: table name
+    :type name: str
+    :param client: low-level DynamoDB client, defaults to the shared client
+    :type client: botocore client, optional
+    """
+
+    def __init__(self, name: str, client=None):
+        from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+        self.name = name
+        self._client = client
+        self.serializer = TypeSerializer()
+        self.deserializer = TypeDeserializer()
+
+    @property
+    def client(self):
+        return self._client or _get_client()
+
+    def get_item(self, Key: dict, **kwargs) -> dict:
+        resp = self.client.get_item(TableName=self.name, Key=self._serialize(Key), **kwargs)
+        if 'Item' in resp:
+            resp['Item'] = self._deserialize(resp['Item'])
+        return resp
+
+    def put_item(self, Item: dict, **kwargs) -> dict:
+        return self.client.put_item(TableName=self.name, Item=self._serialize(Item), **kwargs)
+
+    def delete_item(self, Key: dict, **kwargs) -> dict:
+        return self.client.delete_item(TableName=self.name, Key=self._serialize(Key), **kwargs)
+
+    def update_item(self, Key: dict, ExpressionAttributeValues: dict=None, **kwargs) -> dict:
+        if ExpressionAttributeValues is not None:
+            kwargs['ExpressionAttributeValues'] = self._serialize(ExpressionAttributeValues)
+        resp = self.client.update_item(TableName=self.name, Key=self._serialize(Key), **kwargs)
+        if 'Attributes' in resp:
+            resp['Attributes'] = self._deserialize(resp['Attributes'])
+        return resp
+
+    def query(self, KeyConditionExpression, FilterExpression=None, **kwargs) -> dict:
+        return self._read(self.client.query, KeyConditionExpression, FilterExpression, kwargs)
+
+    def scan(self, FilterExpression=None, **kwargs) -> dict:
+        return self._read(self.client.scan, None, FilterExpression, kwargs)
+
+    def _read(self, call, key_condition, filter_condition, kwargs) -> dict:
+        from boto3.dynamodb.conditions import ConditionExpressionBuilder
+        # 同じ builder で組み立てると、キー条件とフィルタのプレースホルダが重ならない
+        builder = ConditionExpressionBuilder()
+        names = {}
+        values = {}
+        for param, condition, is_key_condition in [
+            ('KeyConditionExpression', key_condition, True),
+            ('FilterExpression', filter_condition, False),
+        ]:
+            if condition is None:
+                continue
+            built = builder.build_expression(condition, is_key_condition=is_key_condition)
+            kwargs[param] = built.condition_expression
+            names.update(built.attribute_name_placeholders)
+            values.update(built.attribute_value_placeholders)
+        if names:
+            kwargs['ExpressionAttributeNames'] = names
+        if values:
+            kwargs['ExpressionAttributeValues'] = self._serialize(values)
+        if 'ExclusiveStartKey' in kwargs:
+            kwargs['ExclusiveStartKey'] = self._serialize(kwargs['ExclusiveStartKey'])
+        resp = call(TableName=self.name, **kwargs)
+        resp['Items'] = [self._deserialize(item) for item in resp.get('Items', [])]
+        if 'LastEvaluatedKey' in resp:
+            resp['LastEvaluatedKey'] = self._deserialize(resp['LastEvaluatedKey'])
+        return resp
+
+    def _serialize(self, item: dict) -> dict:
+        return {k: self.serializer.serialize(v) for k, v in item.items()}
+
+    def _deserialize(self, item: dict) -> dict:
+        return {k: self.deserializer.deserialize(v) for k, v in item.items()}
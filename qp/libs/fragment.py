@@ -0,0 +1,39 @@
+"""Jinja extension for fragment-level render cache. jinja2 を読み込むので qp.libs.template からのみ遅延 import される"""
+import json
+import hashlib
+from jinja2 import nodes
+from jinja2.ext import Extension
+from qp import metrics
+from qp.libs.template import _get_fragment_cache
+
+
+class FragmentCacheExtension(Extension):
+    """{% fragment 'name', var1, var2 %}...{% endfragment %}
+
+    ブロックの出力を、名前と読み込む変数 (var1, var2) のハッシュをキーにキャッシュする。
+    ブロック内で参照する変数は全て引数に列挙すること (列挙していない変数の変更は検知できない)
+    """
+    tags = {'fragment'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        inputs = []
+        while parser.stream.skip_if('comma'):
+            inputs.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endfragment'], drop_needle=True)
+        call = self.call_method('_render_fragment', [name, nodes.List(inputs)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, name, inputs, caller):
+        cache = _get_fragment_cache()
+        data = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+        key = f"{self.environment.fragment_namespace}:{name}:{hashlib.sha256(data.encode('utf-8')).hexdigest()}"
+        rendered = cache.get(key)
+        if rendered is None:
+            metrics.incr('fragment_cache.misses')
+            rendered = caller()
+            cache.set(key, rendered)
+        else:
+            metrics.incr('fragment_cache.hits')
+        return rendered
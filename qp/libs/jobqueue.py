@@ -1,6 +1,6 @@
 import json
-import boto3
 from qp import settings
+from qp import metrics
 
 from qp.logs import get_logger
 log = get_logger(__name__)
@@ -16,16 +16,20 @@ def _get_queue_url(account, region, queue_name):
 def _get_sqs_client():
     global sqs_client
     if sqs_client is None:
+        import boto3
         sqs_client = boto3.client('sqs')
     return sqs_client
 
 
 def _send_message(queue_url: str, message):
     sqs = _get_sqs_client()
-    return sqs.send_message(
-        QueueUrl=queue_url,
-        MessageBody=message
-    )
+    with metrics.span('sqs.send_message'):
+        result = sqs.send_message(
+            QueueUrl=queue_url,
+            MessageBody=message
+        )
+    metrics.incr('sqs.sent.bytes', len(message.encode('utf-8')))
+    return result
 
 
 def enqueue_template_variables(article_name: str, template_variables):
@@ -0,0 +1,218 @@
+"""Local executor for the state machines defined in serverless.yml
+
+AWS にデプロイせずに QiitaPublisher の流れを実行・計測するためのもの。
+serverless.yml の定義で使っている範囲 (Task, Choice, Pass, Succeed, Fail, InputPath, ResultPath,
+OutputPath, Next, End) だけを解釈し、Task は functions の handler (Python 関数) を直接呼ぶ。
+
+    machine = LocalStateMachine.from_serverless('QiitaPublisher')
+    output = machine.execute({'article': '...'})
+    machine.history  # [{state, type, elapsed}, ...]
+"""
+import json
+import time
+import pathlib
+import importlib
+
+from qp.logs import get_logger
+log = get_logger(__name__)
+
+
+SERVERLESS_YML = pathlib.Path(__file__).parent / '..' / '..' / 'serverless.yml'
+
+
+class StateMachineError(Exception):
+    """Execution failed. error / cause follow Step Functions naming (e.g. States.NoChoiceMatched)"""
+
+    def __init__(self, error, cause=''):
+        super().__init__(f'{error}: {cause}')
+        self.error = error
+        self.cause = cause
+
+
+def load_serverless(path=None) -> dict:
+    import yaml
+    with open(path or SERVERLESS_YML, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+def handler_of(handler: str):
+    """Returns python function of serverless handler string, e.g. qp/functions/sfn/publish.update_item"""
+    module_path, func_name = handler.rsplit('.', 1)
+    module = importlib.import_module(module_path.replace('/', '.'))
+    return getattr(module, func_name)
+
+
+class LocalStateMachine(object):
+    def __init__(self, definition: dict, resolve, context=None):
+        """
+        :param definition: Amazon States Language definition
+        :type definition: dict
+        :param resolve: function which returns python callable handler(event, context) of Task Resource
+        :type resolve: function
+        :param context: context passed to each handler, defaults to {}
+        """
+        self.definition = definition
+        self.resolve = resolve
+        self.context = {} if context is None else context
+        self.history = []
+
+    @classmethod
+    def from_serverless(cls, name: str, path=None, overrides: dict=None):
+        """Build from stepFunctions.stateMachines.<name>.definition of serverless.yml
+
+        Task Resource は ARN 末尾の関数名 (...-${self:provider.stage}-<FunctionName>) から functions.<FunctionName>.handler を引く
+
+        :param name: state machine key, e.g. QiitaPublisher
+        :type name: str
+        :param path: serverless.yml path, defaults to the repository's
+        :param overrides: {FunctionName: callable} to replace handlers (stub), defaults to None
+        :type overrides: dict, optional
+        """
+        config = load_serverless(path)
+        definition = config['stepFunctions']['stateMachines'][name]['definition']
+        functions = config['functions']
+        overrides = overrides or {}
+
+        def resolve(resource):
+            function_name = resource.rsplit('-', 1)[-1]
+            if function_name in overrides:
+                return overrides[function_name]
+            if function_name not in functions:
+                raise StateMachineError('States.Runtime', f'unknown resource {resource}')
+            return handler_of(functions[function_name]['handler'])
+        return cls(definition, resolve)
+
+    def execute(self, data):
+        """Run the state machine and return its output. Per-state timings are recorded in self.history
+
+        :param data: execution input
+        :raises StateMachineError: Fail state, missing choice, unknown state type
+        """
+        self.history = []
+        data = _json_copy(data)
+        name = self.definition['StartAt']
+        while True:
+            state = self.definition['States'][name]
+            started = time.perf_counter()
+            try:
+                data, next_name = self._run_state(name, state, data)
+            finally:
+                self.history.append({
+                    'state': name,
+                    'type': state['Type'],
+                    'elapsed': time.perf_counter() - started
+                })
+            if next_name is None:
+                return data
+            name = next_name
+
+    def _run_state(self, name, state, data):
+        t = state['Type']
+        if t == 'Fail':
+            raise StateMachineError(state.get('Error', 'States.Fail'), state.get('Cause', ''))
+        if t == 'Succeed':
+            return data, None
+        if t == 'Choice':
+            effective = _get_path(data, state.get('InputPath', '$'))
+            for choice in state.get('Choices', []):
+                if _match(choice, effective):
+                    return data, choice['Next']
+            if 'Default' in state:
+                return data, state['Default']
+            raise StateMachineError('States.NoChoiceMatched', name)
+        if t == 'Task':
+            effective = _get_path(data, state.get('InputPath', '$'))
+            func = self.resolve(state['Resource'])
+            # Lambda の入出力は JSON なので、シリアライズできない値はここで失敗させる
+            result = _json_copy(func(_json_copy(effective), self.context))
+        elif t == 'Pass':
+            effective = _get_path(data, state.get('InputPath', '$'))
+            result = state['Result'] if 'Result' in state else effective
+        else:
+            raise StateMachineError('States.Runtime', f'unsupported state type {t} ({name})')
+        data = _set_path(data, state.get('ResultPath', '$'), result)
+        data = _get_path(data, state.get('OutputPath', '$'))
+        if state.get('End', False):
+            return data, None
+        return data, state['Next']
+
+
+def _json_copy(value):
+    return json.loads(json.dumps(value))
+
+
+def _split_path(path: str) -> list:
+    if path == '$':
+        return []
+    if not path.startswith('$.'):
+        raise StateMachineError('States.Runtime', f'unsupported path {path}')
+    return path[2:].split('.')
+
+
+def _get_path(data, path):
+    if path is None:
+        return {}
+    for key in _split_path(path):
+        if not isinstance(data, dict) or key not in data:
+            raise StateMachineError('States.Runtime', f'invalid path {path}')
+        data = data[key]
+    return data
+
+
+def _set_path(data, path, value):
+    if path is None:
+        return data
+    keys = _split_path(path)
+    if not keys:
+        return value
+    target = data
+    for key in keys[:-1]:
+        target = target.setdefault(key, {})
+    target[keys[-1]] = value
+    return data
+
+
+_MISSING = object()
+
+
+def _match(rule: dict, data) -> bool:
+    if 'And' in rule:
+        return all(_match(r, data) for r in rule['And'])
+    if 'Or' in rule:
+        return any(_match(r, data) for r in rule['Or'])
+    if 'Not' in rule:
+        return not _match(rule['Not'], data)
+    try:
+        value = _get_path(data, rule['Variable'])
+    except StateMachineError:
+        value = _MISSING
+    if 'IsPresent' in rule:
+        return (value is not _MISSING) == rule['IsPresent']
+    if value is _MISSING:
+        raise StateMachineError('States.Runtime', f"invalid path {rule['Variable']}")
+    if 'IsNull' in rule:
+        return (value is None) == rule['IsNull']
+    if 'BooleanEquals' in rule:
+        return isinstance(value, bool) and value == rule['BooleanEquals']
+    if 'StringEquals' in rule:
+        return isinstance(value, str) and value == rule['StringEquals']
+    if 'NumericEquals' in rule:
+        return _is_number(value) and value == rule['NumericEquals']
+    if 'NumericGreaterThan' in rule:
+        return _is_number(value) and value > rule['NumericGreaterThan']
+    if 'NumericLessThan' in rule:
+        return _is_number(value) and value < rule['NumericLessThan']
+    raise StateMachineError('States.Runtime', f'unsupported choice rule {rule}')
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+if __name__ == '__main__':
+    import sys
+    machine = LocalStateMachine.from_serverless('QiitaPublisher')
+    output = machine.execute(json.loads(sys.argv[1]))
+    print(json.dumps(output, indent=2, ensure_ascii=False))
+    for h in machine.history:
+        print(f"{h['state']:<32} {h['type']:<8} {h['elapsed'] * 1000:8.1f} ms")
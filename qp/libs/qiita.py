@@ -1,22 +1,89 @@
+import time
+import itertools
+import contextlib
+from typing import TYPE_CHECKING
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, parse_qs
 from qp import settings
+from qp import metrics
 from qp.error import QpError
-from qiita_v2.client import QiitaClient
+from qp.libs.ratelimit import RateLimiter
 from qiita_v2.exception import QiitaApiException
 
-from qp.logs import get_logger
+if TYPE_CHECKING:
+    # 注釈のためだけに import する (実行時は create_qiita() が必要になった時に qp.libs.qiitaclient を読み込む)
+    from qiita_v2.client import QiitaClient
+
+from qp.logs import get_logger, with_payload_sampling
 log = get_logger(__name__)
 
 qiita = None
-
 def _get_qiita_client():
     global qiita
     if qiita is None:
-        qiita = QiitaClient(access_token=settings.QIITA_API_TOKEN)
+        # requests / qiita_v2.client の import は重いので、Qiita API を使う時まで遅らせる
+        from qp.libs.qiitaclient import PooledQiitaClient
+        qiita = PooledQiitaClient(
+            access_token=settings.QIITA_API_TOKEN,
+            base_url=settings.QIITA_API_URL or None
+        )
         log.info(f'QiitaClient initialized')
     return qiita
 
 
+rate_limiter = None
+# レート制限で待てる期限 (epoch seconds)。request_deadline() の間だけ設定する
+deadline = None
+
+def _get_rate_limiter() -> RateLimiter:
+    """Returns process-wide RateLimiter shared by every Qiita instance"""
+    global rate_limiter
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(
+            reserve=settings.QIITA_RATE_LIMIT_RESERVE,
+            max_wait=settings.QIITA_RATE_LIMIT_MAX_WAIT or None
+        )
+    return rate_limiter
+
+
+@contextlib.contextmanager
+def request_deadline(context):
+    """Lambda の残り時間内に Qiita API のリクエストを終えられない場合は、レート制限で待たずに QpError にする
+
+    リクエストを始めるのは、残り時間から HTTP のタイムアウト (接続 + 読み込み) を引いた時刻までとする。
+    Lambda の context でない場合 (ローカル実行など) と入れ子になった場合は何もしない
+
+    :param context: Lambda context
+    """
+    global deadline
+    remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if remaining is None or deadline is not None:
+        yield
+        return
+    request_timeout = settings.QIITA_HTTP_CONNECT_TIMEOUT + settings.QIITA_HTTP_READ_TIMEOUT
+    deadline = time.time() + remaining() / 1000 - request_timeout
+    try:
+        yield
+    finally:
+        deadline = None
+
+
+# item id -> {title, tags}. update_item で title/tags を補うためのキャッシュ
+item_metadata = {}
+# update_item がメタデータを取得しに行った回数など
+stats = Counter()
+
+
+def _cache_item_metadata(item: dict):
+    if not item or 'id' not in item:
+        return
+    item_metadata[item['id']] = {
+        'title': item.get('title', ''),
+        'tags': item.get('tags', [])
+    }
+
+
 class QpItemNotFoundError(QpError):
     pass
 
@@ -31,9 +98,9 @@ class QpItemUpdateError(QpError):
 
 class Qiita(object):
     def __init__(self):
-        self.client: QiitaClient
+        self.client: 'QiitaClient'
 
-    def set_client(self, client: QiitaClient):
+    def set_client(self, client: 'QiitaClient'):
         self.client = client
 
     def get_item(self, item_id: str):
@@ -48,11 +115,12 @@ class Qiita(object):
         :return: dict_value
         :rtype: [type]
         """
-        qiita = _get_qiita_client()
         try:
-            return qiita.get_item(item_id).to_json()
+            item = self._request('get_item', item_id).to_json()
         except QiitaApiException as e:
             raise QpItemNotFoundError(f'item id = {item_id}')
+        _cache_item_metadata(item)
+        return item
     
     def create_item(self, title: str, tags: list, md_content: str, params: dict={}) -> str:
         """[summary]
@@ -63,49 +131,94 @@ class Qiita(object):
         :type md_content: str
         :return: item id
         """
-        p = params
+        p = dict(params)
         p['title'] = title
         p['tags'] = tags
         p['body'] = md_content
         try:
-            res = self.client.create_item(params=p).to_json()
+            res = self._request('create_item', params=p).to_json()
             log.info(f"publisher create an item {res['id']}")
+            _cache_item_metadata(res)
             return res['id']
         except QiitaApiException as e:
             log.error(f"publisher.create {str(e)}")
             raise QpItemCreateError(str(e))
 
-    def update_item(self, id: str, md_content: str) -> str:
+    def update_item(self, id: str, md_content: str, title: str=None, tags: list=None) -> str:
         """
-        タイトルとタグは更新しない仕様なので、いずれDynamoDBから動的に引っ張るようにしたい
+        タイトルとタグは更新しない仕様。
+        title, tags が渡されればそれを使い、無ければプロセス内のメタデータキャッシュ、
+        キャッシュにも無い場合のみ get_item で取得する (stats['update_item_metadata_fallback'])
 
-        render_info = {
-            'template_name': 'str',
-            'template_variables': [
-                {'var1': 'value1'},
-                # ...
-            ]
-        }
+        :param id: item id
+        :type id: str
+        :param md_content: markdown body
+        :type md_content: str
+        :param title: item title, defaults to None
+        :type title: str, optional
+        :param tags: item tags, defaults to None
+        :type tags: list, optional
         :return: item id
         """
-        qiita = _get_qiita_client()
-        item = self.get_item(id)
+        if title is None or tags is None:
+            metadata = item_metadata.get(id)
+            if metadata is None:
+                stats['update_item_metadata_fallback'] += 1
+                log.info(f'update_item: metadata cache miss, fetch item {id}')
+                self.get_item(id)
+                metadata = item_metadata[id]
+            else:
+                stats['update_item_metadata_hit'] += 1
+            title = metadata['title'] if title is None else title
+            tags = metadata['tags'] if tags is None else tags
         p = {
-            'title': item.get('title', ''),
-            'tags': item.get('tags', []),
+            'title': title,
+            'tags': tags,
             'body': md_content
         }
         try:
-            res = qiita.update_item(id=id, params=p).to_json()
+            res = self._request('update_item', id=id, params=p).to_json()
             log.info(f"publisher update an item {res['id']}")
+            _cache_item_metadata(res)
             return res['id']
         except QiitaApiException as e:
             log.error(f"update item {str(e)}")
             raise QpItemUpdateError(str(e))
 
-    def list_own_items(self, page_size=100):
+    def list_own_items(self, page_size=100, max_workers: int=None, fields: list=None):
         """Pagenation を考慮して、item のリストを返す
 
+        全件をメモリに保持するため、件数が多い場合は iter_own_items() を使うこと
+        もしくは fields で必要なキーだけに絞ること (body, rendered_body が大半を占める)
+
+        :param page_size: qiita pagenation per_page, defaults to 100, up to 100
+        :type page_size: int, optional
+        :param max_workers: number of concurrent page requests, defaults to settings.QIITA_FETCH_MAX_WORKERS
+        :type max_workers: int, optional
+        :param fields: item keys to keep, defaults to None (keep all keys)
+        :type fields: list, optional
+        """
+        result = []
+        for page_items in self.iter_own_item_pages(page_size=page_size, max_workers=max_workers, fields=fields):
+            result.extend(page_items)
+        return result
+
+    def iter_own_items(self, page_size=100, max_workers: int=None, fields: list=None):
+        """item を1件ずつ返すジェネレータ。保持されるのは取得済みのページ分のみ
+
+        :param page_size: qiita pagenation per_page, defaults to 100, up to 100
+        :type page_size: int, optional
+        :param max_workers: number of concurrent page requests, defaults to settings.QIITA_FETCH_MAX_WORKERS
+        :type max_workers: int, optional
+        :param fields: item keys to keep, defaults to None (keep all keys)
+        :type fields: list, optional
+        """
+        for page_items in self.iter_own_item_pages(page_size=page_size, max_workers=max_workers, fields=fields):
+            yield from page_items
+
+    def iter_own_item_pages(self, page_size=100, max_workers: int=None, fields: list=None):
+        """Pagenation を考慮して、item のリストをページ単位で返すジェネレータ
+
         # Qiita の Pagenation について
         link ヘッダによって制御される。
 
@@ -126,31 +239,98 @@ class Qiita(object):
 
         ページネーションを含めた総数は 'Total-Count' ヘッダに格納される。qiita_v2 の場合はレスポンスの 'result_count' を参照してintにキャストすることで取得可能。
 
+        2ページ目以降は last_page が判明した時点で max_workers 並列で取得する。結果はページ順に返される。
+
+        fields を指定した場合は、各ページのレスポンスをパースした時点で指定キー以外を捨てる。
+
         :param page_size: qiita pagenation per_page, defaults to 100, up to 100
         :type page_size: int, optional
+        :param max_workers: number of concurrent page requests, defaults to settings.QIITA_FETCH_MAX_WORKERS
+        :type max_workers: int, optional
+        :param fields: item keys to keep, defaults to None (keep all keys)
+        :type fields: list, optional
         """
         page = 1
         resp = self._get_authenticated_user_items(page=page, page_size=page_size)
-        result: list = resp.to_json()
+        yield _project_items(resp.to_json(), fields)
         if resp.link_first == resp.link_last:
-            return result
+            return
 
         last_page, _ = self._get_last_link_page(resp.link_last)
-        for p in range(2, last_page+1):
-            resp = qiita.get_authenticated_user_items(params={
-                'page': p,
-                'per_page': page_size
-            })
-            result.extend(resp.to_json())
-        return result
+        del resp
+        yield from self._fetch_pages(range(2, last_page+1), page_size, max_workers, fields)
+
+    def _fetch_pages(self, pages, page_size: int, max_workers: int=None, fields: list=None):
+        """Returns iterator of page contents (list of item dict) in the order of pages
+
+        :param pages: page numbers
+        :type pages: iterable of int
+        :param page_size: qiita pagenation per_page
+        :type page_size: int
+        :param max_workers: number of concurrent page requests, defaults to settings.QIITA_FETCH_MAX_WORKERS
+        :type max_workers: int, optional
+        :param fields: item keys to keep, defaults to None (keep all keys)
+        :type fields: list, optional
+        """
+        if max_workers is None:
+            max_workers = settings.QIITA_FETCH_MAX_WORKERS
+
+        @with_payload_sampling
+        def fetch(p):
+            resp = self._get_authenticated_user_items(page=p, page_size=page_size)
+            return _project_items(resp.to_json(), fields)
+
+        if max_workers <= 1:
+            for p in pages:
+                yield fetch(p)
+            return
+        # Executor.map は全ページを一度に submit し、読み終わっていない結果も保持し続けるので、
+        # 実行中と取得済みのページを合わせて max_workers 件までに抑え、入力順に返す
+        pages = iter(pages)
+        window = deque()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                for p in itertools.islice(pages, max_workers):
+                    window.append(executor.submit(fetch, p))
+                while window:
+                    result = window.popleft().result()
+                    for p in itertools.islice(pages, 1):
+                        window.append(executor.submit(fetch, p))
+                    yield result
+            finally:
+                # 途中で読むのをやめた場合や失敗した場合は、まだ始まっていないページを取得しない
+                for future in window:
+                    future.cancel()
 
     def _get_authenticated_user_items(self, page: int, page_size: int):
-        qiita = _get_qiita_client()
-        return qiita.get_authenticated_user_items(params={
+        return self._request('get_authenticated_user_items', params={
             'page': page,
             'per_page': page_size
         })
 
+    def _request(self, method: str, *args, **kwargs):
+        """Call QiitaClient method under the shared rate limiter
+
+        :param method: QiitaClient method name
+        :type method: str
+        """
+        limiter = _get_rate_limiter()
+        with metrics.span('qiita.rate_limit_wait'):
+            limiter.acquire(deadline=deadline)
+        metrics.incr('qiita.api_calls')
+        resp = None
+        try:
+            with metrics.span(f'qiita.{method}'):
+                resp = getattr(self.client, method)(*args, **kwargs)
+            return resp
+        except QiitaApiException as e:
+            metrics.incr('qiita.api_errors')
+            if _is_rate_limit_exceeded(e):
+                limiter.exhaust()
+            raise
+        finally:
+            limiter.release(getattr(resp, 'headers', None))
+
     def _get_last_link_page(self, link_last: str):
         """Returns 
 
@@ -169,7 +349,29 @@ class Qiita(object):
 
 
 
-def create_qiita(client: QiitaClient=None):
+def _is_rate_limit_exceeded(e: QiitaApiException) -> bool:
+    # qiita_v2 はエラーレスポンスの JSON を例外の引数に入れる
+    body = e.args[0] if e.args else None
+    return isinstance(body, dict) and body.get('type') == 'rate_limit_exceeded'
+
+
+def _project_items(items: list, fields: list=None) -> list:
+    """Returns items which have only given keys
+
+    :param items: list of item dict
+    :type items: list
+    :param fields: item keys to keep. None means keep all keys
+    :type fields: list, optional
+    """
+    if fields is None:
+        return items
+    return [
+        {k: item[k] for k in fields if k in item}
+        for item in items
+    ]
+
+
+def create_qiita(client: 'QiitaClient'=None):
     qiita = Qiita()
     if client is None:
         qiita.set_client(_get_qiita_client())
@@ -0,0 +1,77 @@
+"""HTTP transport of the Qiita API client. requests を読み込むので qp.libs.qiita から遅延 import される"""
+import requests
+from requests.adapters import HTTPAdapter
+from qiita_v2.client import QiitaClient
+from qiita_v2.exception import QiitaApiException
+from qiita_v2.response import QiitaResponse
+from qp import settings
+from qp import metrics
+
+from qp.logs import get_logger
+log = get_logger(__name__)
+
+session = None
+
+def _get_session() -> requests.Session:
+    """Returns process-wide HTTP session. warm な Lambda では keep-alive 接続と TLS セッションが再利用される"""
+    global session
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.QIITA_HTTP_POOL_SIZE
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        log.info(f'HTTP session initialized: pool_size = {settings.QIITA_HTTP_POOL_SIZE}')
+    return session
+
+
+class PooledQiitaClient(QiitaClient):
+    """QiitaClient that sends every request through the shared pooled session
+
+    qiita_v2 は requests.request() をリクエスト毎に呼ぶため、接続を使い回せない。
+    _request を差し替えて、タイムアウト付きで _get_session() から送る。
+    """
+
+    def __init__(self, access_token=None, base_url: str=None, timeout: tuple=None):
+        """
+        :param access_token: Qiita API access token
+        :type access_token: str
+        :param base_url: API url prefix, defaults to https://qiita.com/api/v2
+        :type base_url: str, optional
+        :param timeout: (connect, read) seconds, defaults to settings
+        :type timeout: tuple, optional
+        """
+        super().__init__(access_token=access_token)
+        self.base_url = base_url
+        self.timeout = timeout or (settings.QIITA_HTTP_CONNECT_TIMEOUT, settings.QIITA_HTTP_READ_TIMEOUT)
+
+    def _url_prefix(self):
+        if self.base_url:
+            return self.base_url
+        return super()._url_prefix()
+
+    def _request(self, method, url, params=None, headers=None):
+        headers = self.header() if headers is None else headers
+        method = method.upper()
+        if method in ('GET', 'DELETE'):
+            kwargs = {'params': params}
+        elif method in ('POST', 'PUT', 'PATCH'):
+            kwargs = {'json': params}
+        else:
+            raise Exception('Unknown method')
+        with metrics.span('qiita.http'):
+            response = _get_session().request(
+                method=method,
+                url=url,
+                headers=headers,
+                timeout=self.timeout,
+                **kwargs
+            )
+        metrics.incr('qiita.sent.bytes', len(response.request.body or b''))
+        metrics.incr('qiita.received.bytes', len(response.content))
+        if response.ok:
+            return QiitaResponse(response)
+        else:
+            raise QiitaApiException(response.json())
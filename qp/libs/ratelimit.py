@@ -0,0 +1,157 @@
+import time
+import threading
+from qp.error import QpError
+
+from qp.logs import get_logger
+log = get_logger(__name__)
+
+
+class RateLimiter(object):
+    """Qiita API のレート制限 (Rate-Remaining / Rate-Reset ヘッダ) に合わせてリクエストを待たせる
+
+    レスポンスヘッダから残り回数とリセット時刻を学習し、
+    残り回数 - 実行中のリクエスト数 が reserve 以下になったらリセット時刻まで待つ。
+    max_wait 秒以内に送れない場合は待たずに QpError を送出する。
+    複数スレッドから共有して使う。
+
+    limiter.acquire()
+    resp = None
+    try:
+        resp = client.get(...)
+    finally:
+        limiter.release(resp.headers if resp else None)
+    """
+
+    def __init__(self, reserve: int=0, max_wait: float=None, clock=time.time):
+        """
+        :param reserve: 使い切らずに残しておく回数, defaults to 0
+        :type reserve: int, optional
+        :param max_wait: 待つ時間の上限 (秒)。None なら上限なし, defaults to None
+        :type max_wait: float, optional
+        :param clock: epoch seconds を返す関数 (テスト用), defaults to time.time
+        :type clock: function, optional
+        """
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.clock = clock
+        self.cond = threading.Condition()
+        # None は未知 (最初のレスポンスを受け取るまで、またはリセット後)
+        self.remaining = None
+        self.reset_at = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self, deadline: float=None):
+        """Block until a request may be sent
+
+        :param deadline: この時刻 (clock と同じ epoch seconds) を過ぎても送れない場合は待たない, defaults to None
+        :type deadline: float, optional
+        :raises QpError: when the request can not be sent within max_wait seconds or by the deadline
+        """
+        with self.cond:
+            started = None
+            while True:
+                now = self.clock()
+                if self.reset_at and now >= self.reset_at:
+                    self.remaining = None
+                    self.reset_at = 0
+                if self._available():
+                    break
+                if started is None:
+                    started = now
+                    self.waits += 1
+                    log.info({
+                        'event': 'rate limit wait',
+                        'remaining': self.remaining,
+                        'in_flight': self.in_flight,
+                        'reset_at': self.reset_at
+                    })
+                # リセット時刻まで、もしくは他のリクエストの完了まで待つ
+                timeout = max(self.reset_at - now, 0) if self.reset_at else None
+                limit = self._limit(started, deadline)
+                if limit is not None:
+                    left = limit - now
+                    if self.in_flight == 0 and timeout is not None and timeout > left:
+                        # 実行中のリクエストがなければリセット時刻まで送れないので、上限を超えるなら待たない
+                        self._give_up(started, now, deadline)
+                    if left <= 0:
+                        self._give_up(started, now, deadline)
+                    timeout = left if timeout is None else min(timeout, left)
+                self.cond.wait(timeout=timeout)
+            if started is not None:
+                self.wait_seconds += self.clock() - started
+            self.in_flight += 1
+            self.requests += 1
+
+    def release(self, headers=None):
+        """Learn rate limit from response headers and wake up waiting requests
+
+        :param headers: response headers, None if request failed without response
+        :type headers: dict, optional
+        """
+        with self.cond:
+            self.in_flight -= 1
+            if headers:
+                self._update(headers)
+            self.cond.notify_all()
+
+    def exhaust(self):
+        """Mark the budget as used up (e.g. 403 rate_limit_exceeded)"""
+        with self.cond:
+            self.remaining = 0
+            if not self.reset_at:
+                # リセット時刻が不明な場合は Qiita の制限単位 (1時間) の先頭まで待つ
+                now = self.clock()
+                self.reset_at = now - now % 3600 + 3600
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                'requests': self.requests,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'remaining': self.remaining,
+                'reset_at': self.reset_at
+            }
+
+    def _limit(self, started: float, deadline: float=None):
+        """Returns time after which acquire() gives up, None if it waits as long as needed"""
+        limit = None if self.max_wait is None else started + self.max_wait
+        if deadline is not None:
+            limit = deadline if limit is None else min(limit, deadline)
+        return limit
+
+    def _give_up(self, started: float, now: float, deadline: float=None):
+        self.wait_seconds += now - started
+        log.warning({
+            'event': 'rate limit wait exceeded',
+            'max_wait': self.max_wait,
+            'deadline': deadline,
+            'remaining': self.remaining,
+            'in_flight': self.in_flight,
+            'reset_at': self.reset_at
+        })
+        raise QpError(
+            f'Qiita API rate limit: can not send a request within {self.max_wait} seconds'
+            f' or by the deadline {deadline} (reset at {self.reset_at})'
+        )
+
+    def _available(self) -> bool:
+        if self.remaining is None:
+            # 残り回数が分かるまでは1件ずつ送る
+            return self.in_flight == 0
+        return self.remaining - self.in_flight > self.reserve
+
+    def _update(self, headers):
+        remaining = headers.get('Rate-Remaining')
+        reset_at = headers.get('Rate-Reset')
+        if remaining is None or reset_at is None:
+            return
+        remaining, reset_at = int(remaining), int(reset_at)
+        if reset_at == self.reset_at and self.remaining is not None:
+            # 並列実行時はレスポンスの到着順が前後するので小さい方を信じる
+            remaining = min(remaining, self.remaining)
+        self.remaining = remaining
+        self.reset_at = reset_at
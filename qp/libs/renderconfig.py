@@ -1,14 +1,22 @@
 import json
+import time
 import decimal
-import boto3
+import threading
 from qp.error import QpError
 from qp import settings
+from qp import metrics
+from qp.libs import dynamodb
+from qp.libs.codec import from_dynamodb
+from qp.libs.varstore import decode_template_variables, ATTRIBUTES as VARIABLE_ATTRIBUTES
 
 from qp import logs
 log = logs.get_logger(__name__)
 
-dynamodb = None
-config_table = None
+# article -> (expires_at, rows)
+article_cache = {}
+cache_lock = threading.Lock()
+# 記事の行。スナップショットは '<article>#snapshot' パーティションに置く
+PARAMETER_TYPES = ('template', 'publish_status')
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -21,67 +29,173 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(o)
 
 
-def _get_dynamodb():
-    global dynamodb
-    if dynamodb is None:
-        dynamodb = boto3.resource('dynamodb')
-    return dynamodb
+def _get_table(table_name: str):
+    # articlestore と同じく、全スレッドで共有する qp.libs.dynamodb の Table を使う
+    return dynamodb.get_table(table_name)
 
 
-def _get_table(table_name: str):
-    global config_table
-    dynamodb = _get_dynamodb()
-    if config_table is None:
-        config_table = dynamodb.Table(table_name)
-    return config_table
+def _query_article_rows(article: str) -> dict:
+    """Returns PARAMETER_TYPES rows of the article keyed by parameter_type (single Query on the hash key)
+
+    Query の FilterExpression にはキー属性 (parameter_type) を使えないので、行の選別はここで行う
+    """
+    from boto3.dynamodb.conditions import Key
+    table = _get_table(settings.ARTICLE_TABLE_NAME)
+    rows = {}
+    kwargs = {'KeyConditionExpression': Key('article').eq(article)}
+    while True:
+        with metrics.span('dynamodb.query'):
+            result = table.query(**kwargs)
+        for item in result['Items']:
+            if item['parameter_type'] in PARAMETER_TYPES:
+                rows[item['parameter_type']] = item
+        if 'LastEvaluatedKey' not in result:
+            return rows
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def load_article(article: str) -> dict:
+    """Returns every row of the article keyed by parameter_type ('template', 'publish_status', ...)
+
+    同じプロセス内では settings.RENDER_CONFIG_CACHE_TTL 秒キャッシュする。
+    put_published_status などの書き込みはキャッシュを破棄する
+
+    :param article: article name
+    :type article: str
+    :rtype: dict
+    """
+    now = time.monotonic()
+    with cache_lock:
+        cached = article_cache.get(article)
+        if cached is not None and cached[0] > now:
+            metrics.incr('render_config_cache.hits')
+            return cached[1]
+    metrics.incr('render_config_cache.misses')
+    rows = _query_article_rows(article)
+    if settings.RENDER_CONFIG_CACHE_TTL > 0:
+        with cache_lock:
+            article_cache[article] = (now + settings.RENDER_CONFIG_CACHE_TTL, rows)
+    return rows
+
+
+def invalidate_article_cache(article: str=None):
+    """Drop cached rows of the article (all articles if None)"""
+    with cache_lock:
+        if article is None:
+            article_cache.clear()
+        else:
+            article_cache.pop(article, None)
 
 
 def find_render_config_by_article(article: str):
-    table = _get_table(settings.ARTICLE_TABLE_NAME)
     log.info(msg=f'find_render_config_by_article: article = {article}')
-    result = table.get_item(Key={
-        'article': article,
-        'parameter_type': 'template'
-    })
-    if not 'Item' in result:
-        log.error(msg=f'find_render_config_by_article: not found {article}')
-    item = result['Item']
-    item.pop('parameter_type')
-    return json.loads(json.dumps(item, cls=DecimalEncoder))
+    return _render_config_of(load_article(article), article)
 
 
 def get_publish_status(article: str):
-    table = _get_table(settings.ARTICLE_TABLE_NAME)
     log.info(msg=f'get_publish_status: article = {article}')
-    result = table.get_item(Key={
-        'article': article,
-        'parameter_type': 'publish_status'
-    })
-    if not 'Item' in result:
+    return _publish_status_of(load_article(article), article)
+
+
+def find_render_config_with_publish_status(article: str):
+    """find_render_config_by_article() の結果に publish_status を加えて返す (Query 1回)
+
+    :return: {article<str>, template_name<str>, template_variables<dict>, tags<list>, publish_status<dict>}
+    :rtype: dict
+    """
+    log.info(msg=f'find_render_config_with_publish_status: article = {article}')
+    rows = load_article(article)
+    config = _render_config_of(rows, article)
+    config['publish_status'] = _publish_status_of(rows, article)
+    return config
+
+
+def list_render_configs_with_publish_status():
+    """Returns find_render_config_with_publish_status() of every article in the table
+
+    テーブルを1回 Scan し、記事ごとの行をまとめて返す (記事ごとの Query は行わない)。
+    スナップショットの行は FilterExpression で除くので転送されないが、Scan の読み込み容量は消費する
+
+    :rtype: list
+    """
+    table = _get_table(settings.ARTICLE_TABLE_NAME)
+    articles = {}
+    kwargs = {'FilterExpression': _parameter_type_filter()}
+    while True:
+        with metrics.span('dynamodb.scan'):
+            result = table.scan(**kwargs)
+        for item in result['Items']:
+            articles.setdefault(item['article'], {})[item['parameter_type']] = item
+        if 'LastEvaluatedKey' not in result:
+            break
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+    configs = []
+    for article, rows in articles.items():
+        if 'template' not in rows:
+            continue
+        config = _render_config_of(rows, article)
+        config['publish_status'] = _publish_status_of(rows, article)
+        configs.append(config)
+    return configs
+
+
+def _parameter_type_filter():
+    from boto3.dynamodb.conditions import Attr
+    return Attr('parameter_type').is_in(list(PARAMETER_TYPES))
+
+
+def _render_config_of(rows: dict, article: str):
+    if not 'template' in rows:
+        log.error(msg=f'find_render_config_by_article: not found {article}')
+        raise QpError(f'render config not found: {article}')
+    item = dict(rows['template'])
+    item.pop('parameter_type')
+    template_variables = decode_template_variables(item)
+    for attribute in VARIABLE_ATTRIBUTES:
+        item.pop(attribute, None)
+    item = from_dynamodb(item)
+    if template_variables is not None:
+        item['template_variables'] = template_variables
+    return item
+
+
+def _publish_status_of(rows: dict, article: str):
+    if not 'publish_status' in rows:
         log.info(msg=f'get_publish_status: item not found article = {article}')
         return {
             'is_published': False,
-            'item_id': None
+            'item_id': None,
+            'content_hash': None
         }
-    item = result['Item']
+    item = rows['publish_status']
     return {
         'is_published': item['publish_status']['is_publish'],
-        'item_id': None if item['publish_status'].get('item_id', '') == '' else item['publish_status'].get('item_id', '')
+        'item_id': None if item['publish_status'].get('item_id', '') == '' else item['publish_status'].get('item_id', ''),
+        'content_hash': item['publish_status'].get('content_hash')
     }
 
 
-def put_published_status(article: str, item_id: str):
+def put_published_status(article: str, item_id: str, content_hash: str=None):
+    """
+    :param content_hash: digest of published markdown, used to skip no-op updates
+    :type content_hash: str, optional
+    """
     table = _get_table(settings.ARTICLE_TABLE_NAME)
-    log.info(f'put_published_status: article = {article}, item_id = {item_id}')
-    table.put_item(Item={
-        'article': article,
-        'parameter_type': 'publish_status',
-        'publish_status': {
-            'is_publish': True,
-            'item_id': item_id
-        }
-    })
-
+    log.info(f'put_published_status: article = {article}, item_id = {item_id}, content_hash = {content_hash}')
+    publish_status = {
+        'is_publish': True,
+        'item_id': item_id
+    }
+    if content_hash is not None:
+        publish_status['content_hash'] = content_hash
+    with metrics.span('dynamodb.put_item'):
+        table.put_item(Item={
+            'article': article,
+            'parameter_type': 'publish_status',
+            'publish_status': publish_status
+        })
+    invalidate_article_cache(article)
 
 if __name__ == '__main__':
     from pprint import pprint
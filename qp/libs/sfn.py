@@ -1,6 +1,8 @@
+import re
 import json
-import boto3
+import hashlib
 from qp import settings
+from qp import metrics
 
 from qp import logs
 log = logs.get_logger(__name__)
@@ -12,6 +14,7 @@ client = None
 def _get_client():
     global client
     if client is None:
+        import boto3
         client = boto3.client('stepfunctions')
     return client
 
@@ -24,8 +27,47 @@ def _get_state_machine_name(name):
     )
 
 
-def start_execution(name, params):
-    return _get_client().start_execution(
-        stateMachineArn=_get_state_machine_name(name),
-        input=params
-    )
\ No newline at end of file
+def start_execution(name, params, execution_name=None):
+    """Start state machine execution
+
+    execution_name を指定した場合、同名の実行が既に存在すれば (ExecutionAlreadyExists) 開始せずに None を返す
+
+    :param name: state machine name
+    :type name: str
+    :param params: execution input (json string)
+    :type params: str
+    :param execution_name: execution name, defaults to None (generated by Step Functions)
+    :type execution_name: str, optional
+    :return: StartExecution response or None
+    """
+    kwargs = {}
+    if execution_name is not None:
+        kwargs['name'] = execution_name
+    client = _get_client()
+    try:
+        with metrics.span('sfn.start_execution'):
+            return client.start_execution(
+                stateMachineArn=_get_state_machine_name(name),
+                input=params,
+                **kwargs
+            )
+    except client.exceptions.ExecutionAlreadyExists:
+        log.info({
+            'event': 'execution already exists',
+            'name': name,
+            'execution_name': execution_name
+        })
+        return None
+
+
+def execution_name_for(key, token):
+    """Returns deterministic execution name (up to 80 chars of [0-9A-Za-z-_])
+
+    :param key: e.g. article name
+    :type key: str
+    :param token: distinguishes executions of the same key, e.g. message id or time window
+    :type token: str
+    """
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    token = re.sub(r'[^0-9A-Za-z_-]', '_', str(token))
+    return f'{digest}-{token}'[:80]
\ No newline at end of file
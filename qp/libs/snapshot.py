@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import zlib
+import uuid
+import pathlib
+from qp import settings
+from qp import metrics
+from qp.libs.articlestore import get_table
+
+from qp.logs import get_logger
+log = get_logger(__name__)
+
+
+# スナップショットに保持する item のキー
+SNAPSHOT_FIELDS = ['id', 'title', 'url', 'created_at', 'updated_at', 'likes_count', 'tags']
+
+
+def empty_snapshot() -> dict:
+    """
+    items: {item_id: compact item}, Qiita API の返却順 (新しい順) を保持する
+    crawled_at: 最後に全件取得した時刻 (epoch seconds)
+    """
+    return {
+        'items': {},
+        'crawled_at': 0
+    }
+
+
+def compact_item(item: dict) -> dict:
+    """Returns snapshot entry of Qiita item
+
+    :param item: Qiita item dict which has SNAPSHOT_FIELDS keys at least
+    :type item: dict
+    """
+    return {
+        'title': item['title'],
+        'url': item['url'],
+        'created_at': item.get('created_at'),
+        'updated_at': item.get('updated_at'),
+        'likes_count': item.get('likes_count', 0),
+        'tags': [tag['name'] for tag in item['tags']]
+    }
+
+
+class FileSnapshotStore(object):
+    """JSON file backend. 主にローカル実行とテスト用"""
+
+    def __init__(self, path: str):
+        self.path = pathlib.Path(path)
+
+    def load(self) -> dict:
+        if not self.path.exists():
+            return empty_snapshot()
+        with self.path.open('r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, snapshot: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with tmp.open('w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+
+class DynamoDBSnapshotStore(object):
+    """Article table backend. zlib 圧縮した JSON を SNAPSHOT_CHUNK_BYTES ごとの行に分けて保存する
+
+    DynamoDB の1アイテムは 400KB までなので、1万件規模のスナップショットは1行に入らない。
+    記事の Query (renderconfig.load_article) で読まれないよう、記事とは別のパーティションに置く。
+
+    - ('<article>#snapshot', 'snapshot')                   : head 行。{generation, chunks}
+    - ('<article>#snapshot', 'snapshot#<generation>#<n>')  : 圧縮データの n 番目の断片
+
+    断片をすべて書いてから head 行を差し替え、その後で前の世代の断片を消すので、
+    読み込み側が書きかけのスナップショットを見ることはない
+    """
+
+    PARAMETER_TYPE = 'snapshot'
+
+    def __init__(self, article: str, table_name: str=None, chunk_bytes: int=None):
+        self.partition = f'{article}#{self.PARAMETER_TYPE}'
+        self.table_name = table_name or settings.ARTICLE_TABLE_NAME
+        self.chunk_bytes = chunk_bytes or settings.SNAPSHOT_CHUNK_BYTES
+
+    def load(self) -> dict:
+        head = self._get(self.PARAMETER_TYPE)
+        if head is None:
+            return empty_snapshot()
+        data = b''.join(
+            self._get(self._chunk_key(head['generation'], n))['snapshot'].value
+            for n in range(int(head['chunks']))
+        )
+        return json.loads(zlib.decompress(data))
+
+    def save(self, snapshot: dict):
+        data = zlib.compress(json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        previous = self._get(self.PARAMETER_TYPE)
+        generation = uuid.uuid4().hex[:12]
+        chunks = [data[i:i + self.chunk_bytes] for i in range(0, len(data), self.chunk_bytes)]
+        table = get_table(self.table_name)
+        for n, chunk in enumerate(chunks):
+            with metrics.span('dynamodb.put_item'):
+                table.put_item(Item={
+                    'article': self.partition,
+                    'parameter_type': self._chunk_key(generation, n),
+                    'snapshot': chunk
+                })
+        with metrics.span('dynamodb.put_item'):
+            table.put_item(Item={
+                'article': self.partition,
+                'parameter_type': self.PARAMETER_TYPE,
+                'generation': generation,
+                'chunks': len(chunks),
+                'size': len(data)
+            })
+        if previous is not None:
+            for n in range(int(previous['chunks'])):
+                with metrics.span('dynamodb.delete_item'):
+                    table.delete_item(Key={
+                        'article': self.partition,
+                        'parameter_type': self._chunk_key(previous['generation'], n)
+                    })
+
+    def _chunk_key(self, generation: str, n: int) -> str:
+        return f'{self.PARAMETER_TYPE}#{generation}#{n:04d}'
+
+    def _get(self, parameter_type: str):
+        with metrics.span('dynamodb.get_item'):
+            result = get_table(self.table_name).get_item(Key={
+                'article': self.partition,
+                'parameter_type': parameter_type
+            })
+        return result.get('Item')
+
+
+def create_snapshot_store(article: str):
+    """Returns snapshot store configured by settings.SNAPSHOT_BACKEND, or None if disabled
+
+    :param article: article name that owns the snapshot
+    :type article: str
+    """
+    backend = settings.SNAPSHOT_BACKEND
+    if backend == 'file':
+        return FileSnapshotStore(settings.SNAPSHOT_PATH)
+    if backend == 'dynamodb':
+        return DynamoDBSnapshotStore(article)
+    return None
+
+
+class SnapshotUpdater(object):
+    """Qiita API の返却順 (新しい順) に item を受け取り、snapshot に差分だけを反映する
+
+    全件取得 (full=True) の場合は、受け取らなかった item を削除済みとして取り除く。
+    タグの出現回数は保持しない (集計は contribution_summarize が items から 1 パスで行う)
+    """
+
+    def __init__(self, snapshot: dict, full: bool=False):
+        self.snapshot = snapshot
+        self.full = full
+        self.seen = {}
+        self.changed = 0
+
+    def apply(self, item: dict) -> bool:
+        """Apply a Qiita item. Returns True if the item was new or changed
+
+        :param item: Qiita item dict which has SNAPSHOT_FIELDS keys at least
+        :type item: dict
+        """
+        entry = compact_item(item)
+        old = self.snapshot['items'].get(item['id'])
+        self.seen[item['id']] = entry
+        if old is not None \
+                and old['updated_at'] == entry['updated_at'] \
+                and old['likes_count'] == entry['likes_count']:
+            return False
+        self.changed += 1
+        return True
+
+    def finish(self) -> dict:
+        """Returns updated snapshot
+
+        今回受け取った item を先頭 (API の返却順) に、それ以外を前回の順序のまま後ろに並べる
+        """
+        items = self.seen
+        for item_id, entry in self.snapshot['items'].items():
+            if item_id in items:
+                continue
+            if self.full:
+                self.changed += 1
+                continue
+            items[item_id] = entry
+        self.snapshot['items'] = items
+        if self.full:
+            self.snapshot['crawled_at'] = int(time.time())
+        return self.snapshot
@@ -1,17 +1,161 @@
+import json
+import hashlib
 import pathlib
-from jinja2 import Environment, PackageLoader
+import threading
+from collections import OrderedDict
+from qp import settings
+from qp import metrics
+
+from qp.logs import get_logger
+log = get_logger(__name__)
+
+TEMPLATE_DIR = pathlib.Path(__file__).parent.parent / 'templates'
+# compile_templates() の出力先。デプロイパッケージに含める
+COMPILED_DIR = pathlib.Path(__file__).parent.parent / 'compiled_templates'
+MANIFEST = 'manifest.json'
+# コンパイル済みテンプレートは拡張をこの名前で参照する
+EXTENSIONS = ['qp.libs.fragment.FragmentCacheExtension']
 
 env = None
+fragment_cache = None
+
+
+class LRUCache(object):
+    """Bounded mapping with LRU eviction and hit / miss counters (thread safe)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.data),
+                'maxsize': self.maxsize
+            }
 
-def _get_env() -> Environment:
+
+def _get_fragment_cache() -> LRUCache:
+    global fragment_cache
+    if fragment_cache is None:
+        fragment_cache = LRUCache(settings.TEMPLATE_FRAGMENT_CACHE_SIZE)
+    return fragment_cache
+
+
+def fragment_cache_stats() -> dict:
+    """Returns {hits, misses, size, maxsize} of the fragment cache"""
+    return _get_fragment_cache().stats()
+
+
+def _create_env(loader):
+    # jinja2 の import は重いので、最初にレンダリングする時まで遅らせる
+    from jinja2 import Environment
+    e = Environment(loader=loader, extensions=EXTENSIONS)
+    # テンプレートのソースが変わったら別のキーになるようにする
+    e.fragment_namespace = hashlib.sha256(json.dumps(_source_digests(), sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return e
+
+
+def _get_env():
+    """プリコンパイル済みのテンプレートがあればそれを優先して読み込む
+
+    コンパイル時のソースのハッシュが現在のソースと異なる場合は使わない
+    """
     global env
     if env is None:
-        env = Environment(
-            loader=PackageLoader('qp', 'templates')
-        )
+        from jinja2 import PackageLoader, ChoiceLoader, ModuleLoader
+        loader = PackageLoader('qp', 'templates')
+        if _compiled_templates_are_fresh():
+            loader = ChoiceLoader([ModuleLoader(str(COMPILED_DIR)), loader])
+        env = _create_env(loader)
     return env
 
 
+def _source_digests() -> dict:
+    return {
+        p.relative_to(TEMPLATE_DIR).as_posix(): hashlib.sha256(p.read_bytes()).hexdigest()
+        for p in sorted(TEMPLATE_DIR.rglob('*.jinja2'))
+    }
+
+
+def _manifest() -> dict:
+    # コンパイル済みのモジュールは jinja2 の内部関数を import するので、バージョンが違えば使えない
+    # (例: Jinja 3 で生成したコードは 2.11 にない str_join を import する)
+    import jinja2
+    return {
+        'jinja2': jinja2.__version__,
+        'extensions': EXTENSIONS,
+        'templates': _source_digests()
+    }
+
+
+def _compiled_templates_are_fresh() -> bool:
+    manifest = COMPILED_DIR / MANIFEST
+    if not manifest.exists():
+        return False
+    if json.loads(manifest.read_text()) != _manifest():
+        log.warning({
+            'event': 'compiled templates are stale, compile on demand',
+            'compiled_dir': str(COMPILED_DIR)
+        })
+        return False
+    return True
+
+
+def compile_templates(target: pathlib.Path=COMPILED_DIR):
+    """Precompile every template under qp/templates into python modules (build step)
+
+    python -m qp.libs.template compile
+
+    sls package / sls deploy の前に serverless_plugins/build-templates が npm run build:templates で実行する
+
+    :param target: output directory, defaults to qp/compiled_templates
+    :type target: pathlib.Path, optional
+    """
+    target = pathlib.Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    for old in target.glob('tmpl_*.py'):
+        old.unlink()
+    from jinja2 import PackageLoader
+    _create_env(PackageLoader('qp', 'templates')).compile_templates(
+        str(target),
+        extensions=['jinja2'],
+        zip=None,
+        ignore_errors=False
+    )
+    (target / MANIFEST).write_text(json.dumps(_manifest(), indent=2))
+    return target
+
+
 def render_template(template_name: str, **kwargs):
     """Return rendered string
 
@@ -21,8 +165,32 @@ def render_template(template_name: str, **kwargs):
     :return: rendered string
     :rtype: str
     """
-    return _get_env().get_template(template_name).render(**kwargs)
+    template = _get_env().get_template(template_name)
+    with metrics.span('template.render'):
+        return template.render(**kwargs)
+
+
+def content_digest(content: str, title: str=None, tags: list=None) -> str:
+    """Return hex digest of rendered content (and the title and tags published with it)
+
+    :param content: rendered string
+    :type content: str
+    :param title: item title, defaults to None (content only)
+    :type title: str, optional
+    :param tags: item tags, defaults to None (content only)
+    :type tags: list, optional
+    :rtype: str
+    """
+    digest = hashlib.sha256(content.encode('utf-8'))
+    if title is not None or tags is not None:
+        digest.update(b'\0' + json.dumps([title, tags], ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
 
 
 class RenderConfig(object):
-    pass
\ No newline at end of file
+    pass
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] == ['compile']:
+        print(f'compiled templates into {compile_templates()}')
@@ -0,0 +1,129 @@
+"""Storage format of template_variables on the article table
+
+DynamoDB の1アイテムは 400KB まで、読み込みコストもサイズに比例するため、
+大きな template_variables は次のいずれかの形で保存する。
+
+- template_variables      : DynamoDB map (COMPRESS_THRESHOLD 未満)
+- template_variables_z    : zlib 圧縮した JSON の Binary (OFFLOAD_THRESHOLD 未満)
+- template_variables_ref  : オブジェクトストア上の圧縮 JSON のキー
+
+読み込み側は decode_template_variables() で形式を意識せずに取り出せる。
+"""
+import json
+import zlib
+import hashlib
+import pathlib
+from qp import settings
+from qp import metrics
+from qp.error import QpError
+from qp.libs.codec import to_dynamodb, from_dynamodb
+
+from qp.logs import get_logger
+log = get_logger(__name__)
+
+
+ATTRIBUTES = ('template_variables', 'template_variables_z', 'template_variables_ref')
+
+object_store = None
+
+
+class LocalObjectStore(object):
+    """Directory backend. テストとローカル実行用"""
+
+    def __init__(self, path: str):
+        self.path = pathlib.Path(path)
+
+    def put(self, key: str, data: bytes):
+        p = self.path / key
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_bytes(data)
+
+    def get(self, key: str) -> bytes:
+        return (self.path / key).read_bytes()
+
+
+class S3ObjectStore(object):
+    def __init__(self, bucket: str):
+        import boto3
+        self.bucket = bucket
+        self.client = boto3.client('s3')
+
+    def put(self, key: str, data: bytes):
+        with metrics.span('s3.put_object'):
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+        metrics.incr('s3.sent.bytes', len(data))
+
+    def get(self, key: str) -> bytes:
+        with metrics.span('s3.get_object'):
+            data = self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        metrics.incr('s3.received.bytes', len(data))
+        return data
+
+
+def _get_object_store():
+    """Returns object store configured by settings, or None"""
+    global object_store
+    if object_store is None:
+        if settings.TEMPLATE_VARIABLES_BUCKET:
+            object_store = S3ObjectStore(settings.TEMPLATE_VARIABLES_BUCKET)
+        elif settings.TEMPLATE_VARIABLES_DIR:
+            object_store = LocalObjectStore(settings.TEMPLATE_VARIABLES_DIR)
+    return object_store
+
+
+def encode_template_variables(template_variables: dict) -> tuple:
+    """Returns (attribute_name, attribute_value) to store template_variables
+
+    :param template_variables: template variables
+    :type template_variables: dict
+    :rtype: tuple
+    """
+    data = json.dumps(template_variables, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(data) < settings.TEMPLATE_VARIABLES_COMPRESS_THRESHOLD:
+        return ('template_variables', to_dynamodb(template_variables))
+
+    compressed = zlib.compress(data)
+    if len(compressed) < settings.TEMPLATE_VARIABLES_OFFLOAD_THRESHOLD:
+        return ('template_variables_z', compressed)
+
+    store = _get_object_store()
+    if store is None:
+        log.warning({
+            'event': 'object store is not configured, store template_variables inline',
+            'size': len(compressed)
+        })
+        return ('template_variables_z', compressed)
+    # 内容で決まるキーなので、同じ内容の再書き込みは同じオブジェクトを上書きするだけ
+    key = f'template_variables/{hashlib.sha256(compressed).hexdigest()}.json.z'
+    store.put(key, compressed)
+    return ('template_variables_ref', key)
+
+
+def decode_template_variables(item: dict):
+    """Returns template_variables stored in the article's template row
+
+    :param item: template row returned by DynamoDB
+    :type item: dict
+    :raises QpError: when the item refers to the object store but it is not configured
+    :return: template variables, None if the item has none
+    :rtype: dict
+    """
+    if 'template_variables' in item:
+        return from_dynamodb(item['template_variables'])
+    if 'template_variables_z' in item:
+        return json.loads(zlib.decompress(_bytes_of(item['template_variables_z'])))
+    if 'template_variables_ref' in item:
+        key = item['template_variables_ref']
+        store = _get_object_store()
+        if store is None:
+            raise QpError(
+                f'template_variables is stored in the object store ({key}), '
+                'but neither TEMPLATE_VARIABLES_BUCKET nor TEMPLATE_VARIABLES_DIR is set'
+            )
+        return json.loads(zlib.decompress(store.get(key)))
+    return None
+
+
+def _bytes_of(value) -> bytes:
+    # boto3 の resource は Binary 型 (value 属性に bytes) で返す
+    return getattr(value, 'value', value)
@@ -1,49 +1,209 @@
-import os
 import json
+import time
+import random
+import atexit
+import hashlib
 import logging
-from datetime import datetime
+import functools
+import threading
+import contextlib
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 
 from qp import settings
 
 
 class JsonFormatter(logging.Formatter):
+    """1 レコードを 1 行の JSON にする
+
+    dict の msg は str() せずそのまま埋め込む。JSON にできない値 (Decimal, datetime, 例外など) は str() で出力する
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # strftime は秒単位の部分だけ、秒が変わったときに作り直す
+        self._timestamp_second = None
+        self._timestamp_prefix = ''
+
     def format(self, record: logging.LogRecord):
-        line = {}
-        rdict = record.__dict__
-        if 'asctime' in rdict:
-            line['asctime'] = self.formatTime(record)
-        if 'levelno' in rdict:
-            line['level'] = logging.getLevelName(record.levelno)
-        if 'name' in rdict:
-            line['name'] = record.name
-        if 'fliename' in rdict:
-            line['filename'] = record.filename
-        if 'exc_info' in rdict and rdict.get('exc_info', None) is not None:
+        line = {
+            'level': record.levelname,
+            'name': record.name,
+        }
+        if record.exc_info:
             line['exc_info'] = self.formatException(record.exc_info)
-        if 'stack_info' in rdict and rdict.get('stack_info', None) is not None:
+        if record.stack_info:
             line['stack_info'] = self.formatStack(record.stack_info)
-        if 'created' in rdict:
-            dt = datetime.fromtimestamp(rdict['created'])
-            line['@timestamp'] = dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        if 'msg' in rdict:
-            if not isinstance(rdict['msg'], dict):
-                line['msg'] = rdict['msg']
-            else:
-                line['msg'] = str(rdict['msg'])
-        return json.dumps(line)
+        line['@timestamp'] = self._format_timestamp(record.created)
+        msg = record.msg
+        if isinstance(msg, str) and record.args:
+            msg = record.getMessage()
+        if settings.LOG_FIELD_MAX_LENGTH > 0 and not _is_sampled(msg, getattr(record, 'payload_draw', None)):
+            msg = cap_payload(msg)
+        line['msg'] = msg
+        return json.dumps(line, default=str)
+
+    def _format_timestamp(self, created):
+        second = int(created)
+        if second != self._timestamp_second:
+            self._timestamp_prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second))
+            self._timestamp_second = second
+        return f'{self._timestamp_prefix}.{int((created - second) * 1e6):06d}Z'
 
 
 class JsonLogger(logging.Logger):
     def __init__(self, name, level):
         super().__init__(name, level)
-    
-    def makeRecord(self, name, lvl, fn, lno, msg, args, exc_info, func, extra, sinfo):
-        return super().makeRecord(name, lvl, fn, lno, msg, args, exc_info, func, extra, sinfo)
+
+    def makeRecord(self, *args, **kwargs):
+        record = super().makeRecord(*args, **kwargs)
+        # QueueListener のスレッドで format されても呼び出し時の抽選結果を使えるよう、レコードに持たせる
+        record.payload_draw = getattr(sampling, 'draw', None)
+        return record
+
+
+def _parse_sample_rates(value):
+    """'Content has rendered=0.1,Update item=1' -> {'Content has rendered': 0.1, 'Update item': 1.0}"""
+    rates = {}
+    for pair in value.split(','):
+        if '=' in pair:
+            event, rate = pair.rsplit('=', 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+sample_rates = _parse_sample_rates(settings.LOG_PAYLOAD_SAMPLE_RATES)
+sampling = threading.local()
+
+
+@contextlib.contextmanager
+def payload_sampling():
+    """この with ブロックの間に出すログで、大きいフィールドを全量出力するかを 1 回だけ抽選する
+
+    LOG_PAYLOAD_SAMPLE_RATE (event ごとには LOG_PAYLOAD_SAMPLE_RATES) の割合の実行で全量を出力する。
+    抽選は 1 回なので、当たった実行では率がそれ以上の event のログがすべて全量になる。
+    入れ子になった場合は外側の抽選結果を使う (express mode の publish_article から呼ぶ各ステップなど)
+    """
+    if getattr(sampling, 'draw', None) is not None:
+        yield
+        return
+    sampling.draw = random.random()
+    try:
+        yield
+    finally:
+        sampling.draw = None
+
+
+def with_payload_sampling(func):
+    """呼び出し元スレッドの抽選結果を使って func を実行する関数を返す
+
+    sampling はスレッドごとなので、ThreadPoolExecutor のワーカーはそのままでは抽選結果を持たない。
+    executor.map(with_payload_sampling(func), ...) のように、submit する側のスレッドで包む
+
+    :param func: function run in worker threads
+    :type func: function
+    """
+    draw = getattr(sampling, 'draw', None)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(sampling, 'draw', None)
+        sampling.draw = draw
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sampling.draw = previous
+    return wrapper
+
+
+def _is_sampled(msg, draw):
+    if draw is None:
+        return False
+    event = msg.get('event') if isinstance(msg, dict) else None
+    return draw < sample_rates.get(event, settings.LOG_PAYLOAD_SAMPLE_RATE)
+
+
+def cap_payload(value, max_length=None):
+    """LOG_FIELD_MAX_LENGTH 文字を超えるフィールドを、長さとダイジェストに置き換える
+
+    dict は値ごとに再帰的に調べる。それ以外の値は JSON にした長さで判定し、超えたら
+    {length, sha256, head} に置き換える。sha256 は content_digest() と同じく str の UTF-8 に対して計算する
+
+    :param value: log message or field
+    :param max_length: defaults to settings.LOG_FIELD_MAX_LENGTH
+    :type max_length: int, optional
+    :return: value whose large fields are replaced
+    """
+    if max_length is None:
+        max_length = settings.LOG_FIELD_MAX_LENGTH
+    if isinstance(value, dict):
+        return {k: cap_payload(v, max_length) for k, v in value.items()}
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(text) <= max_length:
+        return value
+    return {
+        'length': len(text),
+        'sha256': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+        'head': text[:min(max_length, 80)],
+    }
+
+
+loggers = {}
+loggers_lock = threading.Lock()
+listener = None
+
+
+class JsonQueueHandler(QueueHandler):
+    """レコードをキューに積むだけの QueueHandler
+
+    JSON にする処理と書き込みは QueueListener のスレッドで行う。dict の msg は後から書き換えられても
+    ログの内容が変わらないよう、積む時点で浅いコピーを取る
+    """
+    def prepare(self, record):
+        if isinstance(record.msg, dict):
+            record.msg = dict(record.msg)
+        return record
+
+
+def _create_handler() -> logging.Handler:
+    """LOG_QUEUE が有効なら JsonQueueHandler を返す
+
+    Lambda は応答を返すとプロセスを凍結するので、キューに残った行は次の起動時か終了時に出力される
+    """
+    global listener
+    if not settings.LOG_QUEUE:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        return handler
+    if listener is None:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(JsonFormatter())
+        listener = QueueListener(SimpleQueue(), stream_handler)
+        listener.start()
+        atexit.register(listener.stop)
+    return JsonQueueHandler(listener.queue)
 
 
 def get_logger(name, level=settings.LOG_LEVEL) -> JsonLogger:
-    log = JsonLogger(name, level)
-    handler = logging.StreamHandler()
-    handler.setFormatter(JsonFormatter())
-    log.addHandler(handler)
-    return log
\ No newline at end of file
+    """name と level の組ごとに 1 つの JsonLogger を返す
+
+    ハンドラの追加は初回だけ行う
+
+    :param name: logger name
+    :type name: str
+    :param level: log level
+    :type level: str or int
+    :return: cached logger
+    :rtype: JsonLogger
+    """
+    key = (name, level)
+    log = loggers.get(key)
+    if log is None:
+        with loggers_lock:
+            log = loggers.get(key)
+            if log is None:
+                log = JsonLogger(name, level)
+                log.addHandler(_create_handler())
+                loggers[key] = log
+    return log
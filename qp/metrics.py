@@ -0,0 +1,170 @@
+"""Per-invocation timing spans and counters
+
+handler の 1 回の実行ごとに、外部呼び出し (Qiita API, DynamoDB, S3, SQS, Step Functions) とレンダリングの
+所要時間、呼び出し回数、転送バイト数、キャッシュのヒット数を集計し、終了時に sink へ渡す。
+
+Lambda は 1 プロセスで同時に 1 つの実行しか扱わないので、集計はプロセス全体で 1 つ持つ
+(handler が使うスレッドプールからも同じ集計に記録される)
+
+sink は settings.METRICS_SINK で選ぶ。
+
+- emf: CloudWatch Embedded Metric Format の JSON を標準出力に書く (CloudWatch Logs がメトリクスに変換する)
+- log: qp.logs の JSON ログとして出す
+- none: 出力しない (snapshot() で参照はできる)
+
+register_sink() で任意の sink を追加できる
+"""
+import json
+import time
+import threading
+import contextlib
+from collections import Counter
+from qp import settings
+
+from qp.logs import get_logger
+log = get_logger(__name__)
+
+
+lock = threading.Lock()
+# name -> count / bytes
+counters = Counter()
+# span name -> (total milliseconds, calls)
+timings = {}
+# 入れ子になった invocation() の深さ。外側の invocation() だけが集計をリセットして sink に渡す
+depth = 0
+
+
+def incr(name: str, value=1):
+    """Add value to the counter of this invocation. 名前が '.bytes' で終わるものは Bytes として出力する"""
+    with lock:
+        counters[name] += value
+
+
+@contextlib.contextmanager
+def span(name: str):
+    """with ブロックの所要時間を name.time (ms) に、回数を name.calls に加える
+
+    :param name: span name such as 'dynamodb.query'
+    :type name: str
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            total, calls = timings.get(name, (0.0, 0))
+            timings[name] = (total + elapsed, calls + 1)
+
+
+def reset():
+    with lock:
+        counters.clear()
+        timings.clear()
+
+
+def snapshot() -> dict:
+    """Returns metrics of this invocation as {name: (value, unit)}"""
+    with lock:
+        metrics = {}
+        for name, (total, calls) in sorted(timings.items()):
+            metrics[f'{name}.time'] = (round(total, 3), 'Milliseconds')
+            metrics[f'{name}.calls'] = (calls, 'Count')
+        for name, value in sorted(counters.items()):
+            metrics[name] = (value, 'Bytes' if name.endswith('.bytes') else 'Count')
+        return metrics
+
+
+@contextlib.contextmanager
+def invocation(handler: str):
+    """handler の 1 回の実行を囲む。終了時に集計を sink に渡す
+
+    入れ子になった場合 (express mode の publish_article から呼ぶ各ステップ、jobconsumer のスレッドから呼ぶ
+    publish_article など) は外側の実行に集計する
+
+    :param handler: handler name, used as the metric dimension
+    :type handler: str
+    """
+    global depth
+    with lock:
+        depth += 1
+        outermost = depth == 1
+    if outermost:
+        reset()
+    try:
+        with span('invocation'):
+            yield
+    finally:
+        with lock:
+            depth -= 1
+        if outermost:
+            _emit(handler, snapshot())
+
+
+def emf_sink(handler: str, metrics: dict):
+    """Print metrics in CloudWatch Embedded Metric Format"""
+    if not metrics:
+        return
+    line = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': settings.METRICS_NAMESPACE,
+                'Dimensions': [['handler']],
+                'Metrics': [
+                    {'Name': name, 'Unit': unit}
+                    # 1 つの directive に入れられるメトリクスは 100 個まで
+                    for name, (_, unit) in list(metrics.items())[:100]
+                ]
+            }]
+        },
+        'handler': handler
+    }
+    for name, (value, _) in metrics.items():
+        line[name] = value
+    print(json.dumps(line), flush=True)
+
+
+def log_sink(handler: str, metrics: dict):
+    log.info({
+        'event': 'metrics',
+        'handler': handler,
+        'metrics': {name: value for name, (value, _) in metrics.items()}
+    })
+
+
+sinks = {
+    'emf': emf_sink,
+    'log': log_sink,
+    'none': lambda handler, metrics: None,
+}
+
+
+def register_sink(name: str, sink):
+    """Add sink selectable by settings.METRICS_SINK
+
+    :param name: sink name
+    :type name: str
+    :param sink: function(handler<str>, metrics<dict of {name: (value, unit)}>)
+    :type sink: function
+    """
+    sinks[name] = sink
+
+
+def _emit(handler: str, metrics: dict):
+    sink = sinks.get(settings.METRICS_SINK)
+    if sink is None:
+        log.warning({
+            'event': 'unknown metrics sink',
+            'sink': settings.METRICS_SINK
+        })
+        return
+    try:
+        sink(handler, metrics)
+    except Exception as e:
+        # メトリクスの出力失敗で handler を失敗させない
+        log.exception({
+            'event': 'failed to emit metrics',
+            'handler': handler,
+            'error': str(e)
+        })
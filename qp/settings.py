@@ -1,27 +1,83 @@
 import os
 import pathlib
-from dotenv import load_dotenv
 
 
 QP_ENV = os.environ.get('QP_ENV', 'dev')
 ENV_FILE = pathlib.Path(__file__).parent / '..' / f".env.{QP_ENV}"
 
-if not ENV_FILE.exists():
-    FileNotFoundError(f'{ENV_FILE.absolute()}.')
-
-load_dotenv(ENV_FILE.resolve().absolute())
+# Lambda では serverless-dotenv-plugin がデプロイ時に環境変数へ展開済みなので .env は読まない
+if 'AWS_LAMBDA_FUNCTION_NAME' not in os.environ and ENV_FILE.exists():
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE.resolve().absolute())
 
 # env
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG')
+# 1 にするとログの書き込みを別スレッドで行う (qp.logs.get_logger)
+LOG_QUEUE = os.environ.get('LOG_QUEUE', '0') == '1'
+# ログの各フィールドをこの文字数までに切り詰め、超えた分は長さと sha256 に置き換える。0 で無効
+LOG_FIELD_MAX_LENGTH = int(os.environ.get('LOG_FIELD_MAX_LENGTH', '2048'))
+# 切り詰めずに全量を出力する実行の割合 (0.0 - 1.0)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', '0'))
+# event ごとの割合。'Content has rendered=0.1,Update item=1' の形式で、ここにない event は LOG_PAYLOAD_SAMPLE_RATE
+LOG_PAYLOAD_SAMPLE_RATES = os.environ.get('LOG_PAYLOAD_SAMPLE_RATES', '')
 QIITA_API_TOKEN = os.environ.get('QIITA_API_TOKEN', '')
 QIITA_USER_ID = os.environ.get('QIITA_USER_ID', '')
 ARTICLE_TABLE_NAME = os.environ.get('ARTICLE_TABLE_NAME', '')
 PUBLISH_REQUEST_QUEUE_NAME = os.environ.get('PUBLISH_REQUEST_QUEUE_NAME')
 UPDATE_TEMPLATE_VARIABLES_QUEUE_NAME = os.environ.get('UPDATE_TEMPLATE_VARIABLES_QUEUE_NAME')
 
+# Metrics (emf | log | none)。qp.metrics を参照
+METRICS_SINK = os.environ.get('METRICS_SINK', 'emf')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'QiitaPublisher')
+
+# Qiita API
+QIITA_API_URL = os.environ.get('QIITA_API_URL', '')
+QIITA_HTTP_POOL_SIZE = int(os.environ.get('QIITA_HTTP_POOL_SIZE', '10'))
+QIITA_HTTP_CONNECT_TIMEOUT = float(os.environ.get('QIITA_HTTP_CONNECT_TIMEOUT', '3.05'))
+QIITA_HTTP_READ_TIMEOUT = float(os.environ.get('QIITA_HTTP_READ_TIMEOUT', '30'))
+QIITA_FETCH_MAX_WORKERS = int(os.environ.get('QIITA_FETCH_MAX_WORKERS', '4'))
+# レート制限の残り回数がこの数になったらリセットまで待つ
+QIITA_RATE_LIMIT_RESERVE = int(os.environ.get('QIITA_RATE_LIMIT_RESERVE', '5'))
+# レート制限で待つ時間の上限 (秒)。超える場合は QpError。0 なら上限なし
+QIITA_RATE_LIMIT_MAX_WAIT = float(os.environ.get('QIITA_RATE_LIMIT_MAX_WAIT', '30'))
+
+# Contribution snapshot (none | file | dynamodb)
+SNAPSHOT_BACKEND = os.environ.get('SNAPSHOT_BACKEND', 'none')
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', '/tmp/qp-contribution-snapshot.json')
+# updated_at が変わらない Like 数の変化と削除を拾うため、この秒数ごとに全件取得する
+SNAPSHOT_FULL_CRAWL_INTERVAL = int(os.environ.get('SNAPSHOT_FULL_CRAWL_INTERVAL', str(7 * 24 * 60 * 60)))
+# dynamodb backend で1行に保存する圧縮データのバイト数 (DynamoDB の1アイテムは 400KB まで)
+SNAPSHOT_CHUNK_BYTES = int(os.environ.get('SNAPSHOT_CHUNK_BYTES', '300000'))
+
 # AWS
 AWS_ACCOUNT_ID = os.environ.get('AWS_ACCOUNT_ID')
 AWS_REGION = os.environ.get('AWS_REGION')
 
+# Article table
+ARTICLE_STORE_MAX_WORKERS = int(os.environ.get('ARTICLE_STORE_MAX_WORKERS', '8'))
+
+# template_variables の JSON がこのバイト数以上なら zlib 圧縮して Binary で保存する
+TEMPLATE_VARIABLES_COMPRESS_THRESHOLD = int(os.environ.get('TEMPLATE_VARIABLES_COMPRESS_THRESHOLD', '16384'))
+# 圧縮後もこのバイト数以上ならオブジェクトストア (S3 bucket / ローカルディレクトリ) に保存する
+TEMPLATE_VARIABLES_OFFLOAD_THRESHOLD = int(os.environ.get('TEMPLATE_VARIABLES_OFFLOAD_THRESHOLD', '262144'))
+TEMPLATE_VARIABLES_BUCKET = os.environ.get('TEMPLATE_VARIABLES_BUCKET', '')
+TEMPLATE_VARIABLES_DIR = os.environ.get('TEMPLATE_VARIABLES_DIR', '')
+
+# load_article() のキャッシュ有効期間 (秒)。0 で無効
+# 書き込みによる破棄は同一プロセス内にしか効かないため、別の Lambda が書き込む構成では 0 のままにすること
+RENDER_CONFIG_CACHE_TTL = float(os.environ.get('RENDER_CONFIG_CACHE_TTL', '0'))
+
+# Job consumer
+JOB_CONSUMER_MAX_WORKERS = int(os.environ.get('JOB_CONSUMER_MAX_WORKERS', '8'))
+
+# Template
+# {% fragment %} の出力を保持する件数。0 で無効
+TEMPLATE_FRAGMENT_CACHE_SIZE = int(os.environ.get('TEMPLATE_FRAGMENT_CACHE_SIZE', '256'))
+
+# Batch publisher
+BATCH_PUBLISH_MAX_WORKERS = int(os.environ.get('BATCH_PUBLISH_MAX_WORKERS', '4'))
+
 # StateMachine
+# sfn: ステートマシンを実行する / express: jobconsumer の中で publish_article を直接呼ぶ
+PUBLISHER_MODE = os.environ.get('PUBLISHER_MODE', 'sfn')
 PUBLISHER_STATEMACHINE_NAME = os.environ.get('PUBLISHER_STATEMACHINE_NAME')
\ No newline at end of file
@@ -0,0 +1,22 @@
+'use strict';
+
+const { execSync } = require('child_process');
+
+// Precompile qp/templates into qp/compiled_templates before the deployment package is built.
+// pipenv の環境 (Pipfile.lock の jinja2) でコンパイルするので、Lambda に入る jinja2 とバージョンが一致する
+class BuildTemplates {
+  constructor(serverless) {
+    this.serverless = serverless;
+    this.hooks = {
+      'before:package:createDeploymentArtifacts': this.build.bind(this),
+      'before:deploy:function:packageFunction': this.build.bind(this),
+    };
+  }
+
+  build() {
+    this.serverless.cli.log('Compiling templates...');
+    execSync('npm run build:templates', { stdio: 'inherit' });
+  }
+}
+
+module.exports = BuildTemplates;
@@ -0,0 +1,124 @@
+import random
+import unittest
+from collections import Counter
+
+from qp.libs.aggregate import TopK, TopItems, TopCounts, Aggregator, aggregate, year_of, month_of
+
+
+def _sorted_top_items(items, k):
+    """以前の contribution_summarize と同じ: (likes, -index) の降順"""
+    entries = [(item['likes_count'], -index, item) for index, item in enumerate(items)]
+    entries.sort(key=lambda e: e[:2], reverse=True)
+    return [item for _, _, item in entries[:k]]
+
+
+def _sorted_top_counts(items, k):
+    """以前の contribution_summarize と同じ: Counter を出現回数で安定ソート (reverse=True)"""
+    counter = Counter()
+    for item in items:
+        counter.update(item['tags'])
+    keys = sorted(counter, key=lambda key: counter[key], reverse=True)
+    return [(key, counter[key]) for key in keys[:k]]
+
+
+def _items(n, seed=0, likes=5, tags=8):
+    rand = random.Random(seed)
+    return [
+        {
+            'title': f'item {i}',
+            # 値の種類を少なくして同数を多く作る
+            'likes_count': rand.randrange(likes),
+            'tags': rand.sample([f'tag{t}' for t in range(tags)], rand.randint(1, 3)),
+            'created_at': f'20{rand.randrange(18, 21)}-{rand.randrange(1, 13):02d}-01T00:00:00+09:00'
+        }
+        for i in range(n)
+    ]
+
+
+def _definitions(k, group=None):
+    return [
+        TopItems('items', k=k, score=lambda item: item['likes_count'], group=group),
+        TopCounts('tags_count', k=k, keys=lambda item: item['tags'], group=group),
+    ]
+
+
+class TestTopK(unittest.TestCase):
+
+    def test_equal_scores_keep_first_seen_order(self):
+        top = TopK(3)
+        for score, value in [(1, 'a'), (2, 'b'), (1, 'c'), (2, 'd'), (2, 'e'), (1, 'f')]:
+            top.push(score, value)
+        self.assertEqual(top.result(), [(2, 'b'), (2, 'd'), (2, 'e')])
+
+    def test_k_larger_than_n(self):
+        top = TopK(10)
+        for score, value in [(1, 'a'), (3, 'b'), (1, 'c')]:
+            top.push(score, value)
+        self.assertEqual(top.result(), [(3, 'b'), (1, 'a'), (1, 'c')])
+
+    def test_k_zero(self):
+        top = TopK(0)
+        top.push(1, 'a')
+        self.assertEqual(top.result(), [])
+
+
+class TestAggregator(unittest.TestCase):
+
+    def test_matches_stable_sort(self):
+        for seed in range(20):
+            for n in (0, 1, 7, 200):
+                for k in (1, 5, 10, 300):
+                    items = _items(n, seed=seed)
+                    result = aggregate(items, _definitions(k))
+                    with self.subTest(seed=seed, n=n, k=k):
+                        self.assertEqual(result['items'], _sorted_top_items(items, k))
+                        self.assertEqual(result['tags_count'], _sorted_top_counts(items, k))
+
+    def test_tag_counts_ties_keep_first_seen_order(self):
+        items = [
+            {'likes_count': 0, 'tags': ['b', 'a']},
+            {'likes_count': 0, 'tags': ['c']},
+            {'likes_count': 0, 'tags': ['a', 'c', 'd']},
+            {'likes_count': 0, 'tags': ['b']},
+        ]
+        result = aggregate(items, _definitions(3))
+        self.assertEqual(result['tags_count'], [('b', 2), ('a', 2), ('c', 2)])
+
+    def test_value_is_applied(self):
+        items = _items(30, seed=1)
+        result = aggregate(items, [
+            TopItems('items', k=2, score=lambda item: item['likes_count'], value=lambda item: item['title']),
+            TopCounts('tags_count', k=2, keys=lambda item: item['tags'], value=lambda key, count: {key: count}),
+        ])
+        self.assertEqual(result['items'], [item['title'] for item in _sorted_top_items(items, 2)])
+        self.assertEqual(result['tags_count'], [{key: count} for key, count in _sorted_top_counts(items, 2)])
+
+    def test_group(self):
+        items = _items(300, seed=2)
+        for group in (year_of, month_of):
+            result = aggregate(items, _definitions(3, group=group))
+            groups = {}
+            for item in items:
+                groups.setdefault(group(item), []).append(item)
+            with self.subTest(group=group.__name__):
+                self.assertEqual(list(result['items']), list(groups))
+                for key, members in groups.items():
+                    self.assertEqual(result['items'][key], _sorted_top_items(members, 3))
+                    self.assertEqual(result['tags_count'][key], _sorted_top_counts(members, 3))
+
+    def test_items_without_group_are_skipped(self):
+        items = [{'likes_count': 1, 'tags': ['a']}, {'likes_count': 2, 'tags': ['b'], 'created_at': '2020-01-01'}]
+        result = aggregate(items, _definitions(5, group=year_of))
+        self.assertEqual(result['items'], {'2020': [items[1]]})
+        self.assertEqual(result['tags_count'], {'2020': [('b', 1)]})
+
+    def test_feed_incrementally(self):
+        items = _items(50, seed=3)
+        aggregator = Aggregator(_definitions(5))
+        for item in items:
+            aggregator.feed(item)
+        self.assertEqual(aggregator.results(), aggregate(items, _definitions(5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
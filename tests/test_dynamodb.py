@@ -0,0 +1,98 @@
+import unittest
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import Binary
+from botocore.stub import Stubber
+
+from qp.libs.dynamodb import Table
+
+
+class TestTable(unittest.TestCase):
+
+    def setUp(self):
+        client = boto3.client(
+            'dynamodb',
+            region_name='ap-northeast-1',
+            aws_access_key_id='dummy',
+            aws_secret_access_key='dummy'
+        )
+        self.stubber = Stubber(client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        self.table = Table('table', client=client)
+
+    def test_get_item_converts_values_like_resource(self):
+        self.stubber.add_response('get_item', {'Item': {
+            'article': {'S': 'a'},
+            'chunks': {'N': '2'},
+            'snapshot': {'B': b'x'},
+            'tags': {'L': [{'M': {'name': {'S': 'python'}}}]}
+        }}, {'TableName': 'table', 'Key': {'article': {'S': 'a'}, 'parameter_type': {'S': 'template'}}})
+        item = self.table.get_item(Key={'article': 'a', 'parameter_type': 'template'})['Item']
+        self.assertEqual(item['chunks'], Decimal(2))
+        self.assertEqual(item['snapshot'], Binary(b'x'))
+        self.assertEqual(item['tags'], [{'name': 'python'}])
+
+    def test_get_item_without_item(self):
+        self.stubber.add_response('get_item', {}, {
+            'TableName': 'table', 'Key': {'article': {'S': 'a'}, 'parameter_type': {'S': 'x'}}
+        })
+        self.assertNotIn('Item', self.table.get_item(Key={'article': 'a', 'parameter_type': 'x'}))
+
+    def test_put_item_serializes(self):
+        self.stubber.add_response('put_item', {}, {'TableName': 'table', 'Item': {
+            'article': {'S': 'a'},
+            'count': {'N': '1.5'},
+            'data': {'B': b'z'}
+        }})
+        self.table.put_item(Item={'article': 'a', 'count': Decimal('1.5'), 'data': b'z'})
+
+    def test_update_item(self):
+        self.stubber.add_response('update_item', {'Attributes': {'article': {'S': 'a'}, 'n': {'N': '3'}}}, {
+            'TableName': 'table',
+            'Key': {'article': {'S': 'a'}, 'parameter_type': {'S': 'template'}},
+            'UpdateExpression': 'set n=:n',
+            'ExpressionAttributeValues': {':n': {'N': '3'}},
+            'ReturnValues': 'ALL_NEW'
+        })
+        resp = self.table.update_item(
+            Key={'article': 'a', 'parameter_type': 'template'},
+            UpdateExpression='set n=:n',
+            ExpressionAttributeValues={':n': Decimal(3)},
+            ReturnValues='ALL_NEW'
+        )
+        self.assertEqual(resp['Attributes'], {'article': 'a', 'n': Decimal(3)})
+
+    def test_query_builds_key_condition_and_pages(self):
+        self.stubber.add_response('query', {
+            'Items': [{'article': {'S': 'a'}, 'parameter_type': {'S': 'template'}}],
+            'LastEvaluatedKey': {'article': {'S': 'a'}, 'parameter_type': {'S': 'template'}}
+        }, {
+            'TableName': 'table',
+            'KeyConditionExpression': '#n0 = :v0',
+            'ExpressionAttributeNames': {'#n0': 'article'},
+            'ExpressionAttributeValues': {':v0': {'S': 'a'}},
+            'ExclusiveStartKey': {'article': {'S': 'a'}, 'parameter_type': {'S': 'publish_status'}}
+        })
+        resp = self.table.query(
+            KeyConditionExpression=Key('article').eq('a'),
+            ExclusiveStartKey={'article': 'a', 'parameter_type': 'publish_status'}
+        )
+        self.assertEqual(resp['Items'], [{'article': 'a', 'parameter_type': 'template'}])
+        self.assertEqual(resp['LastEvaluatedKey'], {'article': 'a', 'parameter_type': 'template'})
+
+    def test_scan_builds_filter(self):
+        self.stubber.add_response('scan', {'Items': []}, {
+            'TableName': 'table',
+            'FilterExpression': '#n0 IN (:v0, :v1)',
+            'ExpressionAttributeNames': {'#n0': 'parameter_type'},
+            'ExpressionAttributeValues': {':v0': {'S': 'template'}, ':v1': {'S': 'publish_status'}}
+        })
+        resp = self.table.scan(FilterExpression=Attr('parameter_type').is_in(['template', 'publish_status']))
+        self.assertEqual(resp['Items'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import unittest
+from unittest import mock
+
+from qp import settings
+from qp.functions import jobconsumer
+
+
+def _record(message_id, article, version, sent_at):
+    return {
+        'messageId': message_id,
+        'body': json.dumps({'article': article, 'template_variables': {'version': version}}),
+        'attributes': {'SentTimestamp': str(sent_at)}
+    }
+
+
+class TestJobConsumer(unittest.TestCase):
+
+    def setUp(self):
+        self.written = []
+        self.started = []
+        # 書き込み / 実行に失敗させる記事
+        self.put_failures = set()
+        self.start_failures = set()
+        for patcher in [
+            mock.patch.multiple(settings, PUBLISHER_MODE='sfn', PUBLISHER_STATEMACHINE_NAME='publisher', METRICS_SINK='none'),
+            mock.patch.object(jobconsumer, 'put_many_article_template_variables', self._put_many),
+            mock.patch.object(jobconsumer, 'start_execution', self._start_execution),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _put_many(self, updates, return_exceptions=False):
+        results = []
+        for update in updates:
+            self.written.append((update['article'], update['template_variables']['version']))
+            if update['article'] in self.put_failures:
+                results.append(Exception('ProvisionedThroughputExceededException'))
+            else:
+                results.append({'article': update['article']})
+        return results
+
+    def _start_execution(self, name, params, execution_name):
+        article = json.loads(params)['article']
+        self.started.append((article, execution_name))
+        if article in self.start_failures:
+            raise Exception('ServiceUnavailable')
+        return {'executionArn': execution_name}
+
+    def _failures(self, event):
+        return sorted(f['itemIdentifier'] for f in jobconsumer.handler(event, {})['batchItemFailures'])
+
+    def test_newest_message_per_article_is_written(self):
+        event = {'Records': [
+            _record('m1', 'a', 1, 200),
+            _record('m2', 'a', 2, 100),
+            _record('m3', 'b', 1, 100),
+            # 同じ SentTimestamp の場合は後ろのレコードを新しいとみなす
+            _record('m4', 'a', 3, 200),
+        ]}
+        self.assertEqual(self._failures(event), [])
+        self.assertEqual(sorted(self.written), [('a', 3), ('b', 1)])
+        self.assertEqual(sorted(article for article, _ in self.started), ['a', 'b'])
+        names = dict(self.started)
+        self.assertTrue(names['a'].endswith('-m4'))
+
+    def test_invalid_message_is_reported(self):
+        event = {'Records': [
+            {'messageId': 'bad', 'body': 'not json', 'attributes': {}},
+            _record('m1', 'a', 1, 100),
+        ]}
+        self.assertEqual(self._failures(event), ['bad'])
+        self.assertEqual(self.written, [('a', 1)])
+
+    def test_write_failure_retries_every_message_of_the_article(self):
+        self.put_failures.add('a')
+        event = {'Records': [
+            _record('m1', 'a', 1, 100),
+            _record('m2', 'a', 2, 200),
+            _record('m3', 'b', 1, 100),
+        ]}
+        self.assertEqual(self._failures(event), ['m1', 'm2'])
+        # 書き込めなかった記事は実行しない
+        self.assertEqual([article for article, _ in self.started], ['b'])
+
+    def test_publish_failure_retries_every_message_of_the_article(self):
+        self.start_failures.add('b')
+        event = {'Records': [
+            _record('m1', 'a', 1, 100),
+            _record('m2', 'b', 1, 100),
+            _record('m3', 'b', 2, 200),
+        ]}
+        self.assertEqual(self._failures(event), ['m2', 'm3'])
+        self.assertEqual(sorted(article for article, _ in self.started), ['a', 'b'])
+
+    def test_express_mode_publish_failure(self):
+        settings.PUBLISHER_MODE = 'express'
+
+        def publish_article(data, context):
+            if data['article'] == 'b':
+                raise Exception('Qiita API error')
+            return {'item_id': data['article']}
+
+        with mock.patch.object(jobconsumer, 'publish_article', publish_article):
+            event = {'Records': [_record('m1', 'a', 1, 100), _record('m2', 'b', 1, 100)]}
+            self.assertEqual(self._failures(event), ['m2'])
+        self.assertEqual(self.started, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
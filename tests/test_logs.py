@@ -0,0 +1,34 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from qp import logs
+
+
+def _draw(_=None):
+    return getattr(logs.sampling, 'draw', None)
+
+
+class TestPayloadSampling(unittest.TestCase):
+
+    def test_nested_sampling_uses_outer_draw(self):
+        with logs.payload_sampling():
+            outer = _draw()
+            with logs.payload_sampling():
+                self.assertEqual(_draw(), outer)
+        self.assertIsNone(_draw())
+
+    def test_worker_threads_do_not_share_draw_by_default(self):
+        with logs.payload_sampling(), ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(list(executor.map(_draw, range(4))), [None] * 4)
+
+    def test_with_payload_sampling_passes_draw_to_worker_threads(self):
+        with logs.payload_sampling(), ThreadPoolExecutor(max_workers=2) as executor:
+            outer = _draw()
+            draws = list(executor.map(logs.with_payload_sampling(_draw), range(4)))
+            # ワーカーでの実行が終わったら元に戻す
+            self.assertEqual(list(executor.map(_draw, range(4))), [None] * 4)
+        self.assertEqual(draws, [outer] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
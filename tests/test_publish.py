@@ -0,0 +1,98 @@
+import unittest
+from unittest import mock
+
+from qp import settings
+from qp.functions.sfn import publish
+
+
+class FakeQiita(object):
+    def __init__(self):
+        self.updates = []
+        self.creates = []
+
+    def update_item(self, id, md_content, title, tags):
+        self.updates.append((id, md_content, title, tags))
+        return id
+
+    def create_item(self, title, tags, md_content):
+        self.creates.append((title, tags, md_content))
+        return 'new-item'
+
+
+def _data(body='body', tags=None, content_hash=None, is_published=True):
+    return {
+        'article': 'article',
+        'template_name': 'template',
+        'template_variables': {'body': body},
+        'tags': tags if tags is not None else [{'name': 'python', 'versions': []}],
+        'publish_status': {
+            'is_published': is_published,
+            'item_id': 'item' if is_published else None,
+            'content_hash': content_hash
+        }
+    }
+
+
+class TestPublish(unittest.TestCase):
+
+    def setUp(self):
+        self.qiita = FakeQiita()
+        self.published = []
+        for patcher in [
+            mock.patch.object(settings, 'METRICS_SINK', 'none'),
+            mock.patch.object(publish, 'create_qiita', lambda: self.qiita),
+            mock.patch.object(publish, 'render_template', lambda template_name, body: body),
+            mock.patch.object(publish, 'put_published_status', self._put_published_status),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _put_published_status(self, article, item_id, content_hash=None):
+        self.published.append((article, item_id, content_hash))
+
+    def _published_hash(self, data):
+        """data を公開した時に保存されるハッシュ"""
+        self.published.clear()
+        publish.publish_render_config(_data(
+            body=data['template_variables']['body'],
+            tags=data['tags'],
+            is_published=False
+        ))
+        return self.published[-1][2]
+
+    def test_unchanged_content_skips_qiita(self):
+        content_hash = self._published_hash(_data())
+        result = publish.publish_render_config(_data(content_hash=content_hash))
+        self.assertEqual(result, {'item_id': 'item', 'result': 'unchanged'})
+        self.assertEqual(self.qiita.updates, [])
+
+    def test_changed_body_updates(self):
+        content_hash = self._published_hash(_data())
+        result = publish.publish_render_config(_data(body='new body', content_hash=content_hash))
+        self.assertEqual(result, {'item_id': 'item', 'result': 'updated'})
+        self.assertEqual(self.qiita.updates[0][1], 'new body')
+        self.assertNotEqual(self.published[-1][2], content_hash)
+
+    def test_changed_tags_updates(self):
+        content_hash = self._published_hash(_data())
+        tags = [{'name': 'python', 'versions': []}, {'name': 'aws', 'versions': []}]
+        result = publish.publish_render_config(_data(tags=tags, content_hash=content_hash))
+        self.assertEqual(result['result'], 'updated')
+        self.assertEqual(self.qiita.updates[0][3], tags)
+
+    def test_missing_hash_updates(self):
+        # ハッシュの導入前に公開した記事
+        result = publish.publish_render_config(_data(content_hash=None))
+        self.assertEqual(result['result'], 'updated')
+        self.assertEqual(len(self.qiita.updates), 1)
+        self.assertIsNotNone(self.published[-1][2])
+
+    def test_state_machine_steps_store_the_same_hash(self):
+        data = _data(is_published=False)
+        data['item_id'] = publish.create_item(data, {})
+        publish.update_publish_status(data, {})
+        self.assertEqual(self.published[-1][2], self._published_hash(_data()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import time
+import threading
+import unittest
+from unittest import mock
+
+from qp import settings
+from qp.libs import qiita
+from qp.libs.qiita import Qiita, request_deadline
+
+
+class FakeResponse(object):
+    def __init__(self, items: list):
+        self.items = items
+
+    def to_json(self):
+        return self.items
+
+
+class TestFetchPages(unittest.TestCase):
+
+    def setUp(self):
+        self.qiita = Qiita()
+        self.lock = threading.Lock()
+        self.started = []
+        self.outstanding = 0
+        self.max_outstanding = 0
+        self.qiita._get_authenticated_user_items = self._get_page
+
+    def _get_page(self, page: int, page_size: int):
+        with self.lock:
+            self.started.append(page)
+            self.outstanding += 1
+            self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        # 後のページほど早く返して、結果が入力順に並ぶことを確かめる
+        time.sleep(0.01 * (page % 3))
+        return FakeResponse([{'id': page}])
+
+    def _consume(self, pages):
+        for items in pages:
+            with self.lock:
+                self.outstanding -= 1
+            yield items
+
+    def test_pages_are_returned_in_order(self):
+        pages = list(self._consume(self.qiita._fetch_pages(range(1, 21), page_size=1, max_workers=4)))
+        self.assertEqual(pages, [[{'id': p}] for p in range(1, 21)])
+
+    def test_fetched_but_unread_pages_are_bounded_by_max_workers(self):
+        for _ in self._consume(self.qiita._fetch_pages(range(1, 41), page_size=1, max_workers=4)):
+            time.sleep(0.005)
+        self.assertLessEqual(self.max_outstanding, 4)
+
+    def test_closing_early_does_not_fetch_remaining_pages(self):
+        pages = self.qiita._fetch_pages(range(1, 1001), page_size=1, max_workers=4)
+        next(pages)
+        pages.close()
+        self.assertLessEqual(len(self.started), 5)
+
+
+class FakeContext(object):
+    def __init__(self, remaining_ms: int):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+class TestRequestDeadline(unittest.TestCase):
+
+    def test_deadline_leaves_time_for_the_request(self):
+        with mock.patch.multiple(settings, QIITA_HTTP_CONNECT_TIMEOUT=3, QIITA_HTTP_READ_TIMEOUT=30):
+            with request_deadline(FakeContext(120 * 1000)):
+                self.assertAlmostEqual(qiita.deadline, time.time() + 87, delta=1)
+        self.assertIsNone(qiita.deadline)
+
+    def test_nested_deadline_keeps_outer(self):
+        with request_deadline(FakeContext(120 * 1000)):
+            outer = qiita.deadline
+            with request_deadline(FakeContext(600 * 1000)):
+                self.assertEqual(qiita.deadline, outer)
+            self.assertEqual(qiita.deadline, outer)
+
+    def test_without_lambda_context(self):
+        with request_deadline({}):
+            self.assertIsNone(qiita.deadline)
+
+    def test_request_passes_deadline_to_rate_limiter(self):
+        limiter = mock.Mock()
+        client = mock.Mock()
+        q = Qiita()
+        q.set_client(client)
+        with mock.patch.object(qiita, '_get_rate_limiter', return_value=limiter):
+            with request_deadline(FakeContext(120 * 1000)):
+                q._request('get_item', 'id')
+                limiter.acquire.assert_called_once_with(deadline=qiita.deadline)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import threading
+import unittest
+
+from qp.error import QpError
+from qp.libs.ratelimit import RateLimiter
+
+
+class FakeClock(object):
+    def __init__(self, now: float=10000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _headers(remaining: int, reset_at: int) -> dict:
+    return {'Rate-Remaining': str(remaining), 'Rate-Reset': str(reset_at)}
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _acquire_in_thread(self, limiter: RateLimiter):
+        done = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                limiter.acquire()
+            except Exception as e:
+                errors.append(e)
+            done.set()
+        threading.Thread(target=run, daemon=True).start()
+        return done, errors
+
+    def test_first_request_is_sent_one_at_a_time(self):
+        limiter = RateLimiter(clock=self.clock)
+        limiter.acquire()
+        done, _ = self._acquire_in_thread(limiter)
+        self.assertFalse(done.wait(0.1))
+        limiter.release(_headers(100, 20000))
+        self.assertTrue(done.wait(1))
+        self.assertEqual(limiter.stats()['remaining'], 100)
+
+    def test_blocks_while_remaining_is_reserved_by_in_flight_requests(self):
+        limiter = RateLimiter(reserve=2, clock=self.clock)
+        limiter.acquire()
+        limiter.release(_headers(3, 20000))
+        limiter.acquire()
+        done, _ = self._acquire_in_thread(limiter)
+        self.assertFalse(done.wait(0.1))
+        self.assertEqual(limiter.stats()['waits'], 1)
+        # 3 - 1 (in flight) = 2 は reserve 以下なので待つ。完了すると 3 - 0 > reserve になり送れる
+        limiter.release(_headers(3, 20000))
+        self.assertTrue(done.wait(1))
+
+    def test_waits_until_reset(self):
+        limiter = RateLimiter(clock=self.clock)
+        limiter.acquire()
+        limiter.release(_headers(0, 20000))
+        done, _ = self._acquire_in_thread(limiter)
+        self.assertFalse(done.wait(0.1))
+        self.clock.now = 20000
+        with limiter.cond:
+            limiter.cond.notify_all()
+        self.assertTrue(done.wait(1))
+        stats = limiter.stats()
+        self.assertIsNone(stats['remaining'])
+        self.assertEqual(stats['wait_seconds'], 10000)
+
+    def test_reset_time_passed_without_waiting(self):
+        limiter = RateLimiter(clock=self.clock)
+        limiter.acquire()
+        limiter.release(_headers(0, 20000))
+        self.clock.now = 20001
+        limiter.acquire()
+        self.assertEqual(limiter.stats()['waits'], 0)
+
+    def test_exhaust_waits_until_next_hour(self):
+        limiter = RateLimiter(clock=self.clock)
+        limiter.exhaust()
+        self.assertEqual(limiter.stats()['reset_at'], 10800)
+        done, _ = self._acquire_in_thread(limiter)
+        self.assertFalse(done.wait(0.1))
+        self.clock.now = 10800
+        with limiter.cond:
+            limiter.cond.notify_all()
+        self.assertTrue(done.wait(1))
+
+    def test_exhaust_keeps_known_reset_time(self):
+        limiter = RateLimiter(clock=self.clock)
+        limiter.acquire()
+        limiter.release(_headers(10, 12345))
+        limiter.exhaust()
+        stats = limiter.stats()
+        self.assertEqual(stats['remaining'], 0)
+        self.assertEqual(stats['reset_at'], 12345)
+
+    def test_max_wait_raises_without_waiting_when_reset_is_too_far(self):
+        limiter = RateLimiter(max_wait=30, clock=self.clock)
+        limiter.exhaust()
+        with self.assertRaises(QpError):
+            limiter.acquire()
+        self.assertEqual(limiter.stats()['waits'], 1)
+
+    def test_max_wait_allows_reset_within_limit(self):
+        limiter = RateLimiter(max_wait=30, clock=self.clock)
+        limiter.acquire()
+        limiter.release(_headers(0, 10020))
+        done, errors = self._acquire_in_thread(limiter)
+        self.assertFalse(done.wait(0.1))
+        self.clock.now = 10020
+        with limiter.cond:
+            limiter.cond.notify_all()
+        self.assertTrue(done.wait(1))
+        self.assertEqual(errors, [])
+
+    def test_max_wait_raises_when_in_flight_requests_do_not_finish(self):
+        limiter = RateLimiter(max_wait=30, clock=self.clock)
+        limiter.acquire()
+        done, errors = self._acquire_in_thread(limiter)
+        self.assertFalse(done.wait(0.1))
+        self.clock.now += 31
+        with limiter.cond:
+            limiter.cond.notify_all()
+        self.assertTrue(done.wait(1))
+        self.assertIsInstance(errors[0], QpError)
+        self.assertEqual(limiter.in_flight, 1)
+
+
+    def test_deadline_raises_without_waiting_when_reset_is_after_it(self):
+        limiter = RateLimiter(max_wait=30, clock=self.clock)
+        limiter.acquire()
+        limiter.release(_headers(0, 10020))
+        with self.assertRaises(QpError):
+            limiter.acquire(deadline=10010)
+
+    def test_deadline_does_not_block_available_requests(self):
+        limiter = RateLimiter(clock=self.clock)
+        limiter.acquire(deadline=self.clock.now - 1)
+        self.assertEqual(limiter.stats()['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
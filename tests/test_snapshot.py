@@ -0,0 +1,174 @@
+import os
+import json
+import random
+import string
+import tempfile
+import unittest
+from unittest import mock
+
+from qp.libs import dynamodb
+from qp.libs.snapshot import (
+    DynamoDBSnapshotStore,
+    FileSnapshotStore,
+    SnapshotUpdater,
+    empty_snapshot,
+)
+from benchmarks.fakes import FakeResource, FakeTable
+
+
+def _item(id, likes=0, updated_at='2020-01-01T00:00:00+09:00', tags=('python',)):
+    return {
+        'id': id,
+        'title': f'title {id}',
+        'url': f'https://qiita.com/example/items/{id}',
+        'created_at': '2020-01-01T00:00:00+09:00',
+        'updated_at': updated_at,
+        'likes_count': likes,
+        'tags': [{'name': t, 'versions': []} for t in tags],
+    }
+
+
+def _snapshot(*items):
+    updater = SnapshotUpdater(empty_snapshot(), full=True)
+    for item in items:
+        updater.apply(item)
+    return updater.finish()
+
+
+class TestSnapshotUpdater(unittest.TestCase):
+
+    def test_apply_returns_whether_item_changed(self):
+        updater = SnapshotUpdater(_snapshot(_item('a', likes=1), _item('b')))
+        self.assertTrue(updater.apply(_item('c')))
+        self.assertFalse(updater.apply(_item('a', likes=1)))
+        self.assertTrue(updater.apply(_item('b', likes=2)))
+        self.assertTrue(updater.apply(_item('a', likes=1, updated_at='2020-02-01T00:00:00+09:00')))
+        self.assertEqual(updater.changed, 3)
+
+    def test_incremental_keeps_items_not_received(self):
+        snapshot = _snapshot(_item('a'), _item('b'))
+        crawled_at = snapshot['crawled_at']
+        updater = SnapshotUpdater(snapshot, full=False)
+        updater.apply(_item('c', likes=3))
+        updater.apply(_item('a'))
+        result = updater.finish()
+        # 今回受け取った item が API の返却順で先頭に並び、受け取らなかった b は残る
+        self.assertEqual(list(result['items']), ['c', 'a', 'b'])
+        self.assertEqual(result['items']['c']['likes_count'], 3)
+        self.assertEqual(result['crawled_at'], crawled_at)
+        self.assertEqual(updater.changed, 1)
+
+    def test_full_removes_deleted_items(self):
+        snapshot = _snapshot(_item('a'), _item('b'), _item('c'))
+        snapshot['crawled_at'] = 0
+        updater = SnapshotUpdater(snapshot, full=True)
+        updater.apply(_item('a'))
+        updater.apply(_item('c'))
+        result = updater.finish()
+        self.assertEqual(list(result['items']), ['a', 'c'])
+        self.assertGreater(result['crawled_at'], 0)
+        self.assertEqual(updater.changed, 1)
+
+
+class TestFileSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'snapshot', 'contribution.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_load_returns_empty_snapshot_if_missing(self):
+        self.assertEqual(FileSnapshotStore(self.path).load(), empty_snapshot())
+
+    def test_incremental_and_full_runs_round_trip(self):
+        store = FileSnapshotStore(self.path)
+        store.save(_snapshot(_item('a'), _item('b'), _item('c')))
+
+        updater = SnapshotUpdater(store.load(), full=False)
+        updater.apply(_item('d'))
+        store.save(updater.finish())
+        self.assertEqual(list(store.load()['items']), ['d', 'a', 'b', 'c'])
+
+        updater = SnapshotUpdater(store.load(), full=True)
+        for id in ['d', 'a', 'c']:
+            updater.apply(_item(id))
+        store.save(updater.finish())
+        self.assertEqual(list(store.load()['items']), ['d', 'a', 'c'])
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+
+class TestDynamoDBSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FakeTable()
+        patcher = mock.patch.object(dynamodb, 'get_table', FakeResource(self.table).Table)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _large_snapshot(self, n):
+        # 圧縮が効かないタイトルで、圧縮後も 400KB を超える大きさにする
+        rand = random.Random(0)
+        items = []
+        for i in range(n):
+            item = _item(f'{i:020x}', likes=i % 97)
+            item['title'] = ''.join(rand.choice(string.ascii_letters) for _ in range(60))
+            items.append(item)
+        return _snapshot(*items)
+
+    def _chunk_rows(self):
+        return {k[1] for k in self.table.items if k[1] != 'snapshot'}
+
+    def _rows_of(self, article: str):
+        from qp.libs import renderconfig
+        renderconfig.invalidate_article_cache()
+        return renderconfig.load_article(article)
+
+    def test_fake_table_rejects_items_over_400kb(self):
+        from botocore.exceptions import ClientError
+        with self.assertRaises(ClientError):
+            self.table.put_item(Item={'article': 'a', 'parameter_type': 'snapshot', 'snapshot': b'x' * (401 * 1024)})
+
+    def test_fake_table_rejects_query_filter_on_key_attributes(self):
+        from botocore.exceptions import ClientError
+        from boto3.dynamodb.conditions import Attr, Key
+        with self.assertRaises(ClientError):
+            self.table.query(
+                KeyConditionExpression=Key('article').eq('article'),
+                FilterExpression=Attr('parameter_type').is_in(['template'])
+            )
+
+    def test_large_snapshot_is_split_into_chunks(self):
+        store = DynamoDBSnapshotStore('article', table_name='table')
+        snapshot = self._large_snapshot(10000)
+        store.save(snapshot)
+        head = self.table.items[('article#snapshot', 'snapshot')]
+        self.assertGreater(head['size'], FakeTable.MAX_ITEM_BYTES)
+        self.assertGreater(head['chunks'], 1)
+        self.assertEqual(store.load(), json.loads(json.dumps(snapshot)))
+
+    def test_save_removes_previous_chunks(self):
+        store = DynamoDBSnapshotStore('article', table_name='table', chunk_bytes=1000)
+        store.save(self._large_snapshot(100))
+        first = self._chunk_rows()
+        self.assertGreater(len(first), 1)
+        store.save(_snapshot(_item('a')))
+        rows = self._chunk_rows()
+        self.assertEqual(len(rows), 1)
+        self.assertFalse(first & rows)
+        self.assertEqual(list(store.load()['items']), ['a'])
+
+    def test_load_without_snapshot_returns_empty(self):
+        store = DynamoDBSnapshotStore('article', table_name='table')
+        self.assertEqual(store.load(), empty_snapshot())
+
+    def test_snapshot_is_not_read_with_article_rows(self):
+        self.table.put_item(Item={'article': 'article', 'parameter_type': 'template', 'body': ''})
+        store = DynamoDBSnapshotStore('article', table_name='table', chunk_bytes=1000)
+        store.save(self._large_snapshot(100))
+        self.assertEqual(list(self._rows_of('article')), ['template'])
+
+
+if __name__ == '__main__':
+    unittest.main()
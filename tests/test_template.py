@@ -0,0 +1,35 @@
+import tempfile
+import pathlib
+import unittest
+from unittest import mock
+
+import jinja2
+from qp.libs import template
+
+
+class TestCompiledTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        target = pathlib.Path(self.dir.name)
+        template.compile_templates(target)
+        patcher = mock.patch.object(template, 'COMPILED_DIR', target)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compiled_templates_are_fresh(self):
+        self.assertTrue(template._compiled_templates_are_fresh())
+
+    def test_compiled_by_another_jinja2_version_are_stale(self):
+        with mock.patch.object(jinja2, '__version__', '2.11.2'):
+            self.assertFalse(template._compiled_templates_are_fresh())
+
+    def test_changed_source_is_stale(self):
+        digests = dict(template._source_digests(), changed='0')
+        with mock.patch.object(template, '_source_digests', return_value=digests):
+            self.assertFalse(template._compiled_templates_are_fresh())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from qp import settings
+from qp.error import QpError
+from qp.libs import varstore
+from qp.libs.varstore import decode_template_variables, encode_template_variables
+
+
+VARIABLES = {'items': [{'name': f'item {i}', 'likes': i} for i in range(100)]}
+
+
+class TestTemplateVariables(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        for patcher in [
+            mock.patch.object(varstore, 'object_store', None),
+            mock.patch.multiple(settings, TEMPLATE_VARIABLES_BUCKET='', TEMPLATE_VARIABLES_DIR=''),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _round_trip(self, **thresholds):
+        with mock.patch.multiple(settings, **thresholds):
+            attribute, value = encode_template_variables(VARIABLES)
+        return attribute, decode_template_variables({attribute: value})
+
+    def test_inline_map(self):
+        attribute, decoded = self._round_trip(TEMPLATE_VARIABLES_COMPRESS_THRESHOLD=10 ** 6)
+        self.assertEqual(attribute, 'template_variables')
+        self.assertEqual(decoded, VARIABLES)
+
+    def test_compressed(self):
+        attribute, decoded = self._round_trip(TEMPLATE_VARIABLES_COMPRESS_THRESHOLD=0)
+        self.assertEqual(attribute, 'template_variables_z')
+        self.assertEqual(decoded, VARIABLES)
+
+    def test_offloaded_to_object_store(self):
+        settings.TEMPLATE_VARIABLES_DIR = self.dir.name
+        attribute, decoded = self._round_trip(
+            TEMPLATE_VARIABLES_COMPRESS_THRESHOLD=0,
+            TEMPLATE_VARIABLES_OFFLOAD_THRESHOLD=0
+        )
+        self.assertEqual(attribute, 'template_variables_ref')
+        self.assertEqual(decoded, VARIABLES)
+
+    def test_offload_without_object_store_stores_inline(self):
+        attribute, decoded = self._round_trip(
+            TEMPLATE_VARIABLES_COMPRESS_THRESHOLD=0,
+            TEMPLATE_VARIABLES_OFFLOAD_THRESHOLD=0
+        )
+        self.assertEqual(attribute, 'template_variables_z')
+        self.assertEqual(decoded, VARIABLES)
+
+    def test_reference_without_object_store_raises_qp_error(self):
+        with self.assertRaises(QpError):
+            decode_template_variables({'template_variables_ref': 'template_variables/x.json.z'})
+
+    def test_no_variables(self):
+        self.assertIsNone(decode_template_variables({'template_name': 'a'}))
+
+
+if __name__ == '__main__':
+    unittest.main()